@@ -0,0 +1,337 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+from colors import hsv_lut_array
+from effects import Effect, register
+from render import positions
+
+# Audio-reactive input. A reader thread pulls fixed-size blocks of 16-bit PCM
+# from a source into a ring buffer; the "audio" effect takes the newest
+# window each frame, computes Hann-windowed FFT band energies and maps them
+# onto the strip. TRULIGHT_AUDIO picks the source:
+#
+#   alsa:default / alsa:hw:1,0    capture through arecord (alsa-utils)
+#   wav:/path/to/file.wav         a 16-bit WAV played back in real time, looped
+#   stdin                         raw S16_LE mono PCM on standard input
+#
+# Latency is measured from the moment a block arrives to the end of the
+# render that used it. With 256-sample blocks at 44.1 kHz (5.8 ms) and the
+# effect rendering once per block, it stays well under a 60 fps frame period.
+
+RATE = int(os.environ.get("TRULIGHT_AUDIO_RATE", "44100"))
+BLOCK = int(os.environ.get("TRULIGHT_AUDIO_BLOCK", "256"))
+WINDOW = 1024
+BANDS = 16
+LOW_HZ = 40.0
+HIGH_HZ = 16000.0
+
+
+def _alsa_blocks(proc, block):
+    try:
+        yield from _pipe_blocks(proc.stdout, block)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _pipe_blocks(stream, block):
+    size = block * 2
+    while True:
+        data = stream.read(size)
+        while data and len(data) < size:
+            more = stream.read(size - len(data))
+            if not more:
+                break
+            data += more
+        if len(data) < size:
+            return
+        yield np.frombuffer(data, dtype="<i2")
+
+
+def read_wav(path, block):
+    # returns (mono int16 samples, rate); checked up front so a bad file fails
+    # when the source opens, not later on the reader thread
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV files are supported")
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").reshape(-1, channels)
+    if len(pcm) < block:
+        raise ValueError(f"{path}: shorter than one {block}-sample block")
+    mono = pcm.mean(axis=1).astype(np.int16) if channels > 1 else pcm[:, 0].copy()
+    return mono, rate
+
+
+def _wav_blocks(mono, rate, block, loop=True):
+    # paced on absolute deadlines so the file behaves like a live capture
+    period = block / float(rate)
+    deadline = time.monotonic()
+    while True:
+        for start in range(0, len(mono) - block + 1, block):
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield mono[start:start + block]
+        if not loop:
+            return
+
+
+def open_source(spec, rate=RATE, block=BLOCK):
+    # returns (block iterator, sample rate, stop); stop() unblocks a reader
+    # waiting on the source, or is None when the next block comes soon anyway
+    kind, _, arg = spec.partition(":")
+    if kind == "alsa":
+        proc = subprocess.Popen(
+            ["arecord", "-q", "-D", arg or "default", "-f", "S16_LE", "-c", "1", "-r", str(rate), "-t", "raw"],
+            stdout=subprocess.PIPE, bufsize=0,
+        )
+        return _alsa_blocks(proc, block), rate, proc.terminate
+    if kind == "wav":
+        mono, wav_rate = read_wav(arg, block)
+        return _wav_blocks(mono, wav_rate, block), wav_rate, None
+    if kind == "stdin":
+        return _pipe_blocks(sys.stdin.buffer, block), rate, None
+    raise ValueError(f"unknown audio source {spec!r}")
+
+
+class AudioInput:
+    def __init__(self, spec, block=BLOCK, capacity=8192):
+        self.spec = spec
+        self.block = block
+        self.blocks, self.rate, self.stop = open_source(spec, block=block)
+        self.ring = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.written = 0
+        self.arrived = None
+        self.lock = threading.Lock()
+        self.error = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="audio", daemon=True)
+        self.thread.start()
+
+    @property
+    def block_s(self):
+        return self.block / float(self.rate)
+
+    def _run(self):
+        try:
+            for pcm in self.blocks:
+                if not self.running:
+                    break
+                now = time.monotonic()
+                n = len(pcm)
+                with self.lock:
+                    i = self.written % self.capacity
+                    head = min(n, self.capacity - i)
+                    self.ring[i:i + head] = pcm[:head]
+                    self.ring[:n - head] = pcm[head:]
+                    self.written += n
+                    self.arrived = now
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+            print(f"Audio input {self.spec} stopped: {e}")
+
+    def latest(self, out):
+        # copy the newest len(out) samples (scaled to -1..1) into out; returns
+        # the arrival time of the newest block, or None before any audio
+        n = len(out)
+        with self.lock:
+            if self.arrived is None:
+                return None
+            end = self.written % self.capacity
+            start = end - n
+            if start >= 0:
+                out[:] = self.ring[start:end]
+            else:
+                out[:-start] = self.ring[start:]
+                out[-start:] = self.ring[:end]
+            arrived = self.arrived
+        out *= 1.0 / 32768.0
+        return arrived
+
+    def close(self, timeout=1.0):
+        self.running = False
+        if self.stop is not None:
+            self.stop()
+        self.thread.join(timeout)
+
+
+class BandAnalyzer:
+    # log-spaced band energies from one Hann-windowed rfft, with a slowly
+    # decaying peak so levels come out roughly 0-1 whatever the input gain
+    def __init__(self, rate, window=WINDOW, bands=BANDS, low=LOW_HZ, high=HIGH_HZ, decay=0.995):
+        self.window = np.hanning(window).astype(np.float32)
+        self.samples = np.zeros(window, dtype=np.float32)
+        freqs = np.fft.rfftfreq(window, 1.0 / rate)
+        edges = np.geomspace(low, min(high, rate / 2.0), bands + 1)
+        bins = np.searchsorted(freqs, edges)
+        # every band gets at least one bin
+        for i in range(1, len(bins)):
+            bins[i] = max(bins[i], bins[i - 1] + 1)
+        self.starts = bins[:-1]
+        self.stop = bins[-1]
+        self.levels = np.zeros(bands)
+        self.peak = np.full(bands, 1e-3)
+        self.decay = decay
+
+    def analyze(self, samples):
+        spectrum = np.fft.rfft(samples * self.window)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        energy = np.sqrt(np.add.reduceat(power[:self.stop], self.starts))
+        self.peak *= self.decay
+        np.maximum(self.peak, energy, out=self.peak)
+        np.divide(energy, self.peak, out=self.levels)
+        return self.levels
+
+
+_input = None
+_users = 0
+_input_lock = threading.Lock()
+
+
+def get_input(spec=None):
+    # one capture per process, shared by every audio effect instance; each
+    # get_input() is paired with a release_input()
+    global _input, _users
+    with _input_lock:
+        if _input is None:
+            _input = AudioInput(spec or os.environ.get("TRULIGHT_AUDIO", "alsa:default"))
+        _users += 1
+        return _input
+
+
+def release_input(force=False):
+    # the capture (and arecord) stops once nothing is using it
+    global _input, _users
+    with _input_lock:
+        _users = 0 if force else max(0, _users - 1)
+        if _users == 0 and _input is not None:
+            _input.close()
+            _input = None
+
+
+class _Latency:
+    def __init__(self, capacity=256):
+        self.ring = np.zeros(capacity)
+        self.count = 0
+
+    def record(self, seconds):
+        self.ring[self.count % len(self.ring)] = seconds
+        self.count += 1
+
+    def snapshot(self):
+        n = min(self.count, len(self.ring))
+        if n == 0:
+            return None
+        window = self.ring[:n] * 1000.0
+        return {
+            "mean": round(float(window.mean()), 3),
+            "p95": round(float(np.percentile(window, 95)), 3),
+            "max": round(float(window.max()), 3),
+        }
+
+
+latency = _Latency()
+
+
+def stats():
+    if _input is None:
+        return None
+    return {
+        "source": _input.spec,
+        "rate": _input.rate,
+        "block_ms": round(_input.block_s * 1000.0, 3),
+        "samples": _input.written,
+        "error": _input.error,
+        "latency_ms": latency.snapshot(),
+    }
+
+
+@register
+class AudioEffect(Effect):
+    # bass at the centre, treble towards both ends; each band has its own hue
+    name = "audio"
+    bakeable = False
+    attack = 0.6
+    release = 0.25
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        x = positions(num_leds)
+        self.band_of = np.minimum((np.abs(x - 0.5) * 2.0 * BANDS).astype(np.intp), BANDS - 1)
+        band_rgb = hsv_lut_array(np.linspace(0.0, 0.8, BANDS), 1.0, 255.0)
+        self.pixel_rgb = band_rgb[self.band_of]
+        self.smooth = np.zeros(BANDS)
+        self.work = np.zeros((num_leds, 3))
+        self.input = None
+        self.analyzer = None
+
+    def init(self, color):
+        super().init(color)
+        if self.input is None:
+            try:
+                self.input = get_input()
+            except (OSError, ValueError) as e:
+                print(f"Audio input unavailable: {e}")
+                return
+            self.analyzer = BandAnalyzer(self.input.rate)
+        self.smooth[:] = 0.0
+        self.last = None
+
+    def close(self):
+        if self.input is not None:
+            self.input = None
+            release_input()
+
+    def render(self, frame, t):
+        if self.input is None:
+            return False
+        arrived = self.input.latest(self.analyzer.samples)
+        if arrived is None or arrived == self.last:
+            return False
+        self.last = arrived
+        levels = self.analyzer.analyze(self.analyzer.samples)
+
+        rate = np.where(levels > self.smooth, self.attack, self.release)
+        self.smooth += (levels - self.smooth) * rate
+        np.multiply(self.pixel_rgb, self.smooth[self.band_of][:, None], out=self.work)
+        np.copyto(frame, self.work, casting="unsafe")
+        latency.record(time.monotonic() - arrived)
+        return True
+
+    def next_delay(self):
+        return self.input.block_s if self.input is not None else 0.02
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show live band levels and input latency for an audio source")
+    parser.add_argument("source", nargs="?", default=os.environ.get("TRULIGHT_AUDIO", "alsa:default"))
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    source = AudioInput(args.source)
+    analyzer = BandAnalyzer(source.rate)
+    end = time.monotonic() + args.seconds
+    last = None
+    while time.monotonic() < end:
+        arrived = source.latest(analyzer.samples)
+        if arrived is not None and arrived != last:
+            last = arrived
+            levels = analyzer.analyze(analyzer.samples)
+            bars = "".join(" .:-=+*#%@"[min(9, int(v * 9.99))] for v in levels)
+            print(f"\r{bars}  {(time.monotonic() - arrived) * 1000.0:6.2f} ms", end="", flush=True)
+        time.sleep(source.block_s / 2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
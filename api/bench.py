@@ -0,0 +1,158 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from effects import EFFECTS, create_effect
+from output import PixelOutput
+from render import new_frame
+from simulator import VirtualPixels
+
+# Render-cost benchmark for every registered effect. Run from api/:
+#
+#   python -m bench --leds 50 300 1000 --lamps 2 8 --json results.json
+#   python -m bench --compare results.json
+#
+# Each case renders a fixed number of frames into a VirtualPixels sink on a
+# synthetic clock, so runs are repeatable for a given seed.
+
+
+def _drive(effect, output, frame, frames, t):
+    for _ in range(frames):
+        if effect.render(frame, t):
+            output.push(frame)
+        if effect.done:
+            effect.init(effect.color)
+        t += effect.next_delay()
+    return t
+
+
+def run_case(mode, leds, lamps, frames, seed, warmup=10):
+    effect = create_effect(mode, leds, lamps)
+    sink = VirtualPixels(leds, capacity=8)
+    output = PixelOutput(sink, leds)
+    frame = new_frame(leds)
+
+    effect.seed(seed)
+    effect.init((255, 160, 80))
+    t = _drive(effect, output, frame, warmup, 0.0)
+
+    start = time.perf_counter()
+    t = _drive(effect, output, frame, frames, t)
+    elapsed = time.perf_counter() - start
+
+    # separate pass so tracing overhead does not pollute the timings
+    tracemalloc.start()
+    peak = 0
+    blocks = 0
+    sample = min(frames, 50)
+    for _ in range(sample):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        snap_blocks = sys.getallocatedblocks()
+        t = _drive(effect, output, frame, 1, t)
+        peak += tracemalloc.get_traced_memory()[1] - before
+        blocks += max(0, sys.getallocatedblocks() - snap_blocks)
+    tracemalloc.stop()
+
+    us_frame = elapsed / frames * 1e6
+    return {
+        "mode": mode,
+        "leds": leds,
+        "lamps": lamps,
+        "frames": frames,
+        "fps": round(frames / elapsed, 1),
+        "us_per_frame": round(us_frame, 2),
+        "us_per_pixel": round(us_frame / leds, 4),
+        "alloc_bytes_per_frame": round(peak / sample, 1),
+        "retained_blocks_per_frame": round(blocks / sample, 2),
+        "shows": output.sent,
+    }
+
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(modes, leds, lamps, frames, seed):
+    results = []
+    for mode in modes:
+        for n in leds:
+            for lamp_count in lamps:
+                results.append(run_case(mode, n, lamp_count, frames, seed))
+    return {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+            "frames": frames,
+        },
+        "results": results,
+    }
+
+
+def _key(row):
+    return (row["mode"], row["leds"], row["lamps"])
+
+
+def print_report(report, baseline=None):
+    old = {}
+    if baseline is not None:
+        old = {_key(row): row for row in baseline["results"]}
+
+    header = f"{'mode':<16}{'leds':>6}{'lamps':>6}{'fps':>10}{'us/frame':>12}{'us/px':>9}{'B/frame':>10}"
+    if old:
+        header += f"{'vs base':>10}"
+    print(header)
+    for row in report["results"]:
+        line = (
+            f"{row['mode']:<16}{row['leds']:>6}{row['lamps']:>6}{row['fps']:>10.1f}"
+            f"{row['us_per_frame']:>12.1f}{row['us_per_pixel']:>9.3f}{row['alloc_bytes_per_frame']:>10.0f}"
+        )
+        prev = old.get(_key(row))
+        if prev:
+            line += f"{prev['us_per_frame'] / row['us_per_frame']:>9.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-mode render cost")
+    parser.add_argument("--modes", nargs="+", default=sorted(EFFECTS))
+    parser.add_argument("--leds", nargs="+", type=int, default=[50, 300, 1000])
+    parser.add_argument("--lamps", nargs="+", type=int, default=[2, 8])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    args = parser.parse_args(argv)
+
+    unknown = [m for m in args.modes if m not in EFFECTS]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+
+    report = run(args.modes, args.leds, args.lamps, args.frames, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import argparse
+import math
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from effects import EFFECTS, Effect, create_effect, register
+from render import new_frame
+from timing import MAX_FPS
+
+# Pre-rendered clips: N seconds of a mode baked at a fixed frame rate for one
+# LED count, lamp count and seed, then replayed by the "clip" effect straight
+# from a memory-mapped file with no per-pixel math. Bake from api/ with
+#
+#   python -m clips aurora --leds 300 --seconds 30
+#
+# or POST /clips, then select mode "clip:aurora" ("clip" alone plays the most
+# recently used clip for the strip size).
+#
+# File layout (little endian): a 64 byte header
+#   magic "TLCP", version u16, lamps u16, leds u32, frames u32, seed u32,
+#   fps f32, mode 32s (utf-8, NUL padded)
+# followed by frames * leds * 3 RGB bytes.
+#
+# Clips live in TRULIGHT_CLIP_DIR; once the directory grows past
+# TRULIGHT_CLIP_CACHE_MB the least recently used clips are deleted. A single
+# clip may not be larger than that budget, and frames are written to disk as
+# they render, so baking never holds more than the loop seam in memory.
+
+MAGIC = b"TLCP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIf32s")
+HEADER_SIZE = 64
+SUFFIX = ".clip"
+
+CLIP_DIR = os.environ.get("TRULIGHT_CLIP_DIR", os.path.expanduser("~/.cache/trulight/clips"))
+CACHE_BYTES = int(float(os.environ.get("TRULIGHT_CLIP_CACHE_MB", "64")) * 1024 * 1024)
+
+
+def clip_name(mode, leds, lamps, seed, frames, fps):
+    return f"{mode}_{leds}x{lamps}_s{seed}_{frames}f{fps:g}{SUFFIX}"
+
+
+def _prefix(mode, leds, lamps):
+    return f"{mode}_{leds}x{lamps}_"
+
+
+class Clip:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, lamps, leds, frames, seed, fps, mode = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a TruLight clip")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mode = mode.rstrip(b"\x00").decode("utf-8")
+        self.leds = leds
+        self.lamps = lamps
+        self.seed = seed
+        self.fps = fps
+        self.frames = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=(frames, leds, 3))
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def seconds(self):
+        return len(self.frames) / self.fps
+
+    def info(self):
+        return {
+            "name": self.name, "mode": self.mode, "leds": self.leds, "lamps": self.lamps,
+            "seed": self.seed, "fps": self.fps, "frames": len(self.frames),
+            "seconds": round(self.seconds, 3), "bytes": os.path.getsize(self.path),
+        }
+
+
+def bake(mode, leds, lamps, seconds=10.0, fps=40.0, seed=0, crossfade=1.0, color=(255, 160, 80), clip_dir=None):
+    # Renders the effect on a synthetic clock. One extra second is rendered
+    # and cross-faded into the start so the clip loops without a visible seam.
+    cls = EFFECTS.get(mode)
+    if cls is None or not cls.bakeable:
+        raise ValueError(f"Mode {mode!r} cannot be baked into a clip")
+    if leds <= 0 or not (math.isfinite(seconds) and seconds > 0) or not 0 < fps <= MAX_FPS:
+        raise ValueError(f"leds and seconds must be positive and fps 0-{MAX_FPS:g}")
+    if not isinstance(seed, int) or not 0 <= seed <= 0xFFFFFFFF:
+        raise ValueError("seed must be 0-4294967295")
+
+    # sized as a float first so a huge request cannot overflow int()
+    size = seconds * fps * leds * 3
+    if size > CACHE_BYTES:
+        raise ValueError(f"clip would be {size / 2**20:.1f} MB, over the {CACHE_BYTES / 2**20:g} MB clip cache")
+    count = max(1, int(round(seconds * fps)))
+    overlap = min(int(round(crossfade * fps)), count // 4)
+
+    clip_dir = clip_dir or CLIP_DIR
+    os.makedirs(clip_dir, exist_ok=True)
+
+    effect = create_effect(mode, leds, lamps)
+    frame = new_frame(leds)
+    effect.seed(seed)
+    effect.init(color)
+    # the first `overlap` frames stay in memory until the tail is rendered
+    # and cross-faded into them; everything else goes straight to the file
+    head = np.zeros((max(overlap, 1), leds, 3), dtype=np.uint8)
+    held = 0
+    t = 0.0
+    # unique per bake: concurrent POST /clips run on the threadpool
+    fd, tmp = tempfile.mkstemp(prefix=f".bake.{mode}.", suffix=".tmp", dir=clip_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.seek(HEADER_SIZE + overlap * leds * 3)
+            for i in range(count + overlap):
+                effect.render(frame, t)
+                t += 1.0 / fps
+                if effect.done:
+                    # a finite effect (e.g. "test") ends the clip early; one
+                    # that ends at once leaves a single dark frame
+                    count, overlap = max(i, 1), 0
+                    if i == 0:
+                        held = 1
+                    break
+                if i < overlap:
+                    head[i] = frame
+                    held += 1
+                elif i < count:
+                    f.write(frame.tobytes())
+                else:
+                    j = i - count
+                    w = (j + 1) / (overlap + 1)
+                    head[j] = (frame + (head[j].astype(np.float32) - frame) * w + 0.5).astype(np.uint8)
+
+            f.seek(HEADER_SIZE)
+            f.write(head[:held].tobytes())
+            f.seek(0)
+            header = HEADER.pack(MAGIC, VERSION, lamps, leds, count, seed, fps, mode.encode("utf-8")[:32])
+            f.write(header.ljust(HEADER_SIZE, b"\x00"))
+        path = os.path.join(clip_dir, clip_name(mode, leds, lamps, seed, count, fps))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    evict(clip_dir, keep=path)
+    return Clip(path)
+
+
+def list_clips(clip_dir=None):
+    clip_dir = clip_dir or CLIP_DIR
+    try:
+        names = os.listdir(clip_dir)
+    except FileNotFoundError:
+        return []
+    clips = []
+    for name in sorted(names):
+        if name.endswith(SUFFIX):
+            try:
+                clips.append(Clip(os.path.join(clip_dir, name)))
+            except (OSError, ValueError):
+                continue
+    return clips
+
+
+def find_clip(mode, leds, lamps, clip_dir=None):
+    # newest-used clip baked from mode for this strip; mode None matches any
+    clip_dir = clip_dir or CLIP_DIR
+    try:
+        names = os.listdir(clip_dir)
+    except FileNotFoundError:
+        return None
+    best = None
+    best_time = -1.0
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        if mode is not None and not name.startswith(_prefix(mode, leds, lamps)):
+            continue
+        if mode is None and f"_{leds}x{lamps}_" not in name:
+            continue
+        path = os.path.join(clip_dir, name)
+        try:
+            used = os.stat(path).st_mtime
+        except FileNotFoundError:
+            continue
+        if used > best_time:
+            best, best_time = path, used
+    if best is None:
+        return None
+    clip = Clip(best)
+    if clip.leds != leds or clip.lamps != lamps:
+        return None
+    return clip
+
+
+def touch(clip):
+    # mtime doubles as the LRU timestamp; atime is unreliable with noatime mounts
+    try:
+        os.utime(clip.path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(clip_dir=None, budget=None, keep=None):
+    clip_dir = clip_dir or CLIP_DIR
+    budget = CACHE_BYTES if budget is None else budget
+    entries = []
+    for name in os.listdir(clip_dir):
+        if name.endswith(SUFFIX):
+            path = os.path.join(clip_dir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        removed.append(os.path.basename(path))
+    return removed
+
+
+@register
+class ClipEffect(Effect):
+    # Plays a baked clip on a loop, picking the frame from elapsed time so a
+    # late frame never slows the clip down. Falls back to rendering the source
+    # mode live when no clip has been baked for this strip.
+    name = "clip"
+    takes_arg = True
+    bakeable = False
+
+    def __init__(self, num_leds, lamp_count, source=None):
+        super().__init__(num_leds, lamp_count)
+        self.source = source
+        self.clip = None
+        self.live = None
+
+    def init(self, color):
+        super().init(color)
+        self.clip = find_clip(self.source, self.num_leds, self.lamp_count)
+        if self.clip is not None:
+            touch(self.clip)
+            self.live = None
+        elif self.live is None and self.source is not None:
+            self.live = create_effect(self.source, self.num_leds, self.lamp_count)
+        if self.live is not None:
+            self.live.init(color)
+        self.start = None
+        self.index = -1
+
+    def set_color(self, color):
+        super().set_color(color)
+        if self.live is not None:
+            self.live.set_color(color)
+
+    def render(self, frame, t):
+        if self.clip is None:
+            return self.live.render(frame, t) if self.live is not None else False
+        if self.start is None:
+            self.start = t
+        index = int((t - self.start) * self.clip.fps) % len(self.clip)
+        if index == self.index:
+            return False
+        self.index = index
+        frame[:] = self.clip.frames[index]
+        return True
+
+    def next_delay(self):
+        if self.clip is None:
+            return self.live.next_delay() if self.live is not None else 0.04
+        return 1.0 / self.clip.fps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bake a mode into a replayable clip")
+    parser.add_argument("mode", nargs="?", choices=sorted(m for m in EFFECTS if m != ClipEffect.name))
+    parser.add_argument("--leds", type=int, default=50)
+    parser.add_argument("--lamps", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=40.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help=f"clip directory (default {CLIP_DIR})")
+    parser.add_argument("--list", action="store_true", help="list cached clips")
+    args = parser.parse_args(argv)
+
+    if args.list or args.mode is None:
+        for clip in list_clips(args.dir):
+            info = clip.info()
+            print(f"{info['name']:<48}{info['seconds']:>8.1f}s{info['bytes'] / 1024:>10.0f} KiB")
+        return
+
+    start = time.perf_counter()
+    clip = bake(args.mode, args.leds, args.lamps, args.seconds, args.fps, args.seed, clip_dir=args.dir)
+    elapsed = time.perf_counter() - start
+    print(f"baked {clip.name}: {len(clip)} frames in {elapsed:.2f}s ({elapsed / len(clip) * 1e6:.0f} us/frame)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,227 @@
-import json
-import random
-import time
+import atexit
+import importlib.util
 import math
+import os
+import queue
+import time
 import threading
-
-try:
-    import board
-    import neopixel
-    IS_PI = True
-except ImportError:
-    IS_PI = False
-    board = None
-    neopixel = None
+from collections import namedtuple
+
+# start of the startup trace; everything below (NumPy first) counts towards
+# the time to the first lit frame
+STARTED = time.monotonic()
+
+import audio
+import clips
+from correction import Correction, parse_channels
+from cues import MAX_AHEAD, MIN_REPEAT, CueScheduler
+from effects import create_effect, mode_exists
+from persist import StateStore
+from power import PowerLimiter
+from render import new_frame
+from timing import FrameScheduler, FrameStats, parse_fps
+from topology import build_output, canvas_size, load_strips
+from transition import Transition, parse_spec
+
+# Only look the Pi libraries up here. Importing board (Blinka) probes the
+# hardware and is slow, so it is left to the driver when the strip opens.
+IS_PI = importlib.util.find_spec("board") is not None and importlib.util.find_spec("neopixel") is not None
 
 NUM_LEDS = 50
 pixels = None
 LAMP_COUNT = 2
 
-if IS_PI:
-    pixels = neopixel.NeoPixel(board.D18, NUM_LEDS, auto_write=False)
-
-current_mode = "static"
-current_color = (0, 0, 0)
-_lock = threading.Lock()
+output = None
+
+# off the Pi, render into a VirtualPixels recorder unless TRULIGHT_BACKEND=none
+BACKEND = os.environ.get("TRULIGHT_BACKEND", "neopixel" if IS_PI else "sim")
+
+# TRULIGHT_STRIPS points at a JSON strip list (see topology.py); without it
+# there is one strip of NUM_LEDS on GPIO18
+if BACKEND == "neopixel" and not IS_PI:
+    BACKEND = "none"
+
+strips = []
+if BACKEND != "none":
+    strips = load_strips(os.environ.get("TRULIGHT_STRIPS"), [{
+        "driver": BACKEND,
+        "pin": "D18",
+        "length": NUM_LEDS,
+        "frames": int(os.environ.get("TRULIGHT_SIM_FRAMES", "256")),
+        "file": os.environ.get("TRULIGHT_SIM_FILE"),
+    }])
+
+if strips:
+    NUM_LEDS = canvas_size(strips)
+
+# With TRULIGHT_RENDER_PROCESS=1 the animation loop runs in its own process
+# which owns the pixel drivers. The API process keeps the authoritative State
+# and forwards every published snapshot over a queue, so request handlers
+# never wait on rendering and the effect math does not compete with them for
+# the GIL.
+RENDER_PROCESS = os.environ.get("TRULIGHT_RENDER_PROCESS") == "1"
+
+_render_proc = None
+_to_render = None
+_from_render = None
+_in_render_process = False
+_metrics_replies = queue.Queue()
+_metrics_lock = threading.Lock()
+
+# The drivers are opened by the render loop itself, on its own thread (or in
+# the render process), so importing this module and serving the first
+# request never wait on hardware setup.
+def _open_output():
+    global output, pixels
+    if output is None and strips:
+        output = build_output(strips)
+        pixels = output.outputs[0].pixels
+        _mark("driver_init")
+
+def _blank():
+    # leave the strip dark rather than frozen on the last frame
+    if output is not None:
+        output.push(new_frame(NUM_LEDS))
+        output.close()
+
+# every rendered frame is also published to a shared-memory ring so the API,
+# recorders or other drivers can read it (TRULIGHT_FRAMEBUS="" turns it off)
+FRAMEBUS_NAME = os.environ.get("TRULIGHT_FRAMEBUS", "trulight_frames")
+framebus = None
+_frame_reader = None
+
+def _open_framebus():
+    global framebus
+    if framebus is None and FRAMEBUS_NAME and NUM_LEDS:
+        from framebus import FrameBusWriter
+        framebus = FrameBusWriter(FRAMEBUS_NAME, NUM_LEDS)
+        atexit.register(framebus.close)
+
+# Output correction for the strip (see correction.py); brightness is runtime
+# state, gamma and white balance describe the hardware.
+GAMMA = parse_channels(os.environ.get("TRULIGHT_GAMMA"), (1.0, 1.0, 1.0))
+WHITE = parse_channels(os.environ.get("TRULIGHT_WHITE"), (1.0, 1.0, 1.0))
+DITHER = os.environ.get("TRULIGHT_DITHER", "1") != "0"
+
+power = PowerLimiter(
+    NUM_LEDS,
+    budget_ma=float(os.environ.get("TRULIGHT_POWER_LIMIT_MA", "0")),
+    channel_ma=parse_channels(os.environ.get("TRULIGHT_LED_MA"), (20.0, 20.0, 20.0)),
+    idle_ma=float(os.environ.get("TRULIGHT_LED_IDLE_MA", "1")),
+)
+
+# Writers build a new immutable State and publish it with a single reference
+# assignment; the animation loop reads _state without locking and only reacts
+# when the generation moves. prev_* hold what to go back to after "test";
+# transition is the (duration, curve) used for the mode change it came with.
+State = namedtuple("State", ["mode", "color", "transition", "brightness", "prev_mode", "prev_color", "generation"])
+
+_state = State("static", (0, 0, 0), None, 1.0, None, (0, 0, 0), 0)
+_write_lock = threading.Lock()
+_start_lock = threading.Lock()
 _loop_started = False
-
-# store prev state for test
-prev_mode = None
-prev_color = (0, 0, 0)
+_loop_thread = None
+_stopping = threading.Event()
+_render_errors = 0
+_finish_requested = None
+
+frame_stats = FrameStats()
+scheduler = FrameScheduler(frame_stats)
+
+# seconds from STARTED to each startup milestone, reported in metrics
+startup = {
+    "imported": None, "restored": None, "ready": None, "loop_started": None,
+    "driver_init": None, "first_frame": None, "first_lit": None,
+}
+
+def _mark(step, now=None):
+    if startup[step] is None:
+        now = time.monotonic() if now is None else now
+        startup[step] = round(now - STARTED, 4)
+        # the monotonic clock is shared between processes, so the render
+        # process reports its milestones for the API process to time
+        if _in_render_process and _from_render is not None:
+            _from_render.put(("mark", step, now))
+
+# Mode, colour, brightness and per-mode fps survive restarts through a small
+# JSON file (TRULIGHT_STATE_FILE, "" to disable). Only the API process writes
+# it; the render process gets its state over the queue as before.
+STATE_FILE = os.environ.get("TRULIGHT_STATE_FILE", os.path.expanduser("~/.config/trulight/state.json"))
+_store = StateStore(STATE_FILE) if STATE_FILE else None
+_restored = False
+if _store is not None:
+    atexit.register(_store.flush)
+
+def _persist():
+    # caller holds _write_lock; a running test pulse is saved as what it returns to
+    if _store is None or _in_render_process:
+        return
+    state = _state
+    mode, color = state.mode, state.color
+    if mode == "test":
+        mode, color = state.prev_mode or "off", state.prev_color or (0, 0, 0)
+    _store.save({
+        "mode": mode,
+        "color": list(color),
+        "brightness": state.brightness,
+        "fps": dict(scheduler.target_fps),
+    })
+
+def _restore():
+    # each field is checked on its own so one bad value only loses that field
+    global _state, _restored
+    data = _store.load() if _store is not None else None
+    if not data:
+        return
+    changes = {}
+    try:
+        changes["mode"], _ = _parse_op("set_mode", {"mode": data.get("mode", "static")})[1]
+    except ValueError as e:
+        print(f"Ignoring saved mode: {e}")
+    try:
+        changes["color"], _ = _parse_op("set_color", dict(zip("rgb", data.get("color", (0, 0, 0)))))[1]
+    except (TypeError, ValueError) as e:
+        print(f"Ignoring saved colour: {e}")
+    try:
+        changes["brightness"] = _parse_brightness(data.get("brightness", 1.0))
+    except ValueError as e:
+        print(f"Ignoring saved brightness: {e}")
+    fps_modes = data.get("fps") or {}
+    for fps_mode, fps in (fps_modes.items() if isinstance(fps_modes, dict) else ()):
+        try:
+            if not mode_exists(fps_mode):
+                raise ValueError(f"Unknown mode {fps_mode!r}")
+            scheduler.set_target_fps(fps_mode, fps)
+        except ValueError as e:
+            print(f"Ignoring saved fps for {fps_mode!r}: {e}")
+    if not changes:
+        return
+    _state = _state._replace(**changes)
+    _restored = True
+    _mark("restored")
+
+_listeners = []
+
+def add_state_listener(fn):
+    # fn(state) runs after every publish with _write_lock held, so it must
+    # only hand the snapshot off; returns the current state
+    with _write_lock:
+        _listeners.append(fn)
+        return _state
+
+def _publish(**changes):
+    # caller holds _write_lock
+    global _state
+    changes.setdefault("transition", None)
+    _state = _state._replace(generation=_state.generation + 1, **changes)
+    if _to_render is not None:
+        _to_render.put(_state)
+    else:
+        scheduler.interrupt()
+    for fn in _listeners:
+        fn(_state)
+    _persist()
+    return _state
 
 def _wheel(pos):
     if pos < 85:
@@ -38,658 +232,490 @@ def _wheel(pos):
     pos -= 170
     return (0, pos * 3, 255 - pos * 3)
 
-def _animation_loop():
-    global current_mode, current_color
-
-    phase = 0
-    last_mode = None
-    last_color = None
-    sleep_ms = 30
-
-    era_initialized = False
-    era_centers = []
-    era_lamp_level = []
-    era_lamp_target = []
-    era_temps = []
-    era_surge_frames = 0
-    era_surge_total = 0
-    era_surge_strength = 0.0
-    era_buzz_phase = 0.0
-
-    cin_initialized = False
-    cin_centers = []
-    cin_lamp_level = []
-    cin_lamp_target = []
-    cin_temps = []
-    cin_surge_frames = 0
-    cin_surge_total = 0
-    cin_surge_strength = 0.0
-    cin_phase = 0.0
-
-    test_initialized = False
-    test_start = 0.0
-    test_duration = 0.5
-
-    while True:
-        with _lock:
-            mode = current_mode
-            color = current_color
-
-        if mode == "static":
-            if mode != last_mode or color != last_color:
-                r, g, b = color
-                if IS_PI and pixels is not None:
-                    for i in range(NUM_LEDS):
-                        pixels[i] = (r, g, b)
-                    pixels.show()
-
-        elif mode == "fire":
-            base_r, base_g, base_b = 255, 96, 12
-
-            if IS_PI and pixels is not None:
-                for i in range(NUM_LEDS):
-                    flicker = random.randint(0, 40)
-                    r1 = max(base_r - flicker, 0)
-                    g1 = max(base_g - flicker, 0)
-                    b1 = max(base_b - flicker, 0)
-                    pixels[i] = (r1, g1, b1)
-
-                pixels.show()
-
-            sleep_ms = random.randint(50, 150)
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "eras":
-            if not era_initialized:
-                era_centers = []
-                era_lamp_level = []
-                era_lamp_target = []
-                era_temps = []
-                for lamp_idx in range(LAMP_COUNT):
-                    center = (lamp_idx + 0.5) / float(LAMP_COUNT)
-                    era_centers.append(center)
-                    level = random.uniform(0.8, 1.0)
-                    era_lamp_level.append(level)
-                    era_lamp_target.append(level)
-                    base_temp = 2200.0 + (lamp_idx - (LAMP_COUNT - 1) / 2.0) * 80.0
-                    era_temps.append(base_temp)
-                era_initialized = True
-
-            if not IS_PI or pixels is None or not era_centers:
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            era_buzz_phase += 0.25
-            mains_mod = 0.97 + 0.03 * math.sin(era_buzz_phase)
-
-            if era_surge_frames <= 0 and random.random() < 0.003:
-                era_surge_total = random.randint(10, 24)
-                era_surge_frames = era_surge_total
-                era_surge_strength = random.uniform(-0.25, 0.15)
-
-            if era_surge_frames > 0 and era_surge_total > 0:
-                progress = (era_surge_total - era_surge_frames) / float(max(1, era_surge_total))
-                surge_scale = 1.0 + era_surge_strength * math.sin(progress * math.pi)
-                era_surge_frames -= 1
-            else:
-                surge_scale = 1.0
-
-            lamp_r = [0] * LAMP_COUNT
-            lamp_g = [0] * LAMP_COUNT
-            lamp_b = [0] * LAMP_COUNT
-
-            for idx in range(LAMP_COUNT):
-                if random.random() < 0.06:
-                    delta = random.uniform(-0.04, 0.04)
-                    era_lamp_target[idx] = max(0.75, min(1.05, era_lamp_target[idx] + delta))
-                era_lamp_level[idx] += (era_lamp_target[idx] - era_lamp_level[idx]) * 0.18
-
-                k_base = era_temps[idx]
-                k_jitter = random.gauss(0.0, 40.0)
-                k = max(1900.0, min(2600.0, k_base + k_jitter))
-                r, g, b = _kelvin_to_rgb(k)
-
-                lamp_r[idx] = r
-                lamp_g[idx] = g
-                lamp_b[idx] = b
-
-            radius = 0.55 / float(LAMP_COUNT)
-            gamma = 1.8
-            floor = 0.08
-
-            for i in range(NUM_LEDS):
-                gpos = i / float(NUM_LEDS - 1) if NUM_LEDS > 1 else 0.5
-                best_idx = -1
-                best_w = 0.0
-                for idx, center in enumerate(era_centers):
-                    d = abs(gpos - center)
-                    if d >= radius:
-                        continue
-                    w = 1.0 - d / radius
-                    w = w ** gamma
-                    if w > best_w:
-                        best_w = w
-                        best_idx = idx
-
-                if best_idx == -1:
-                    pixels[i] = (0, 0, 0)
-                else:
-                    base_scale = mains_mod * surge_scale * era_lamp_level[best_idx]
-                    base_scale = max(0.7, min(1.05, base_scale))
-                    s = floor + (1.0 - floor) * best_w
-                    s = s * base_scale
-                    r = int(max(0, min(255, lamp_r[best_idx] * s)))
-                    g = int(max(0, min(255, lamp_g[best_idx] * s * 0.94)))
-                    b = int(max(0, min(255, lamp_b[best_idx] * s * 0.7)))
-                    pixels[i] = (r, g, b)
-
-            pixels.show()
-            sleep_ms = random.randint(40, 55)
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "cinematic":
-            if not cin_initialized:
-                cin_centers = []
-                cin_lamp_level = []
-                cin_lamp_target = []
-                cin_temps = []
-                for lamp_idx in range(LAMP_COUNT):
-                    center = (lamp_idx + 0.5) / float(LAMP_COUNT)
-                    cin_centers.append(center)
-                    level = random.uniform(0.8, 1.1)
-                    cin_lamp_level.append(level)
-                    cin_lamp_target.append(level)
-                    base_temp = 2100.0 + (lamp_idx - (LAMP_COUNT - 1) / 2.0) * 120.0
-                    cin_temps.append(base_temp)
-                cin_initialized = True
-
-            if not IS_PI or pixels is None or not cin_centers:
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            cin_phase += 0.03
-            vignette_shift = 0.5 + 0.1 * math.sin(cin_phase)
-            global_dark = 0.35 + 0.25 * (1.0 - abs(0.5 - vignette_shift) * 2.0)
+def _restore_after_test(generation):
+    with _write_lock:
+        # a newer command already replaced the test pulse
+        if _state.generation != generation:
+            return
+        _publish(
+            mode=_state.prev_mode if _state.prev_mode is not None else "off",
+            color=_state.prev_color if _state.prev_color is not None else (0, 0, 0),
+        )
+
+def _finish_test(seen):
+    global _finish_requested
+    if not _in_render_process:
+        _restore_after_test(seen.generation)
+        return
 
-            if cin_surge_frames <= 0 and random.random() < 0.015:
-                cin_surge_total = random.randint(8, 20)
-                cin_surge_frames = cin_surge_total
-                cin_surge_strength = random.uniform(-0.6, 0.4)
+    # the API process owns the state; ask it once and wait for the new snapshot
+    if _finish_requested != seen.generation:
+        _finish_requested = seen.generation
+        _from_render.put(("finish_test", seen.generation))
 
-            if cin_surge_frames > 0 and cin_surge_total > 0:
-                progress = (cin_surge_total - cin_surge_frames) / float(max(1, cin_surge_total))
-                surge_scale = 1.0 + cin_surge_strength * math.sin(progress * math.pi)
-                cin_surge_frames -= 1
-            else:
-                surge_scale = 1.0
-
-            lamp_r = [0] * LAMP_COUNT
-            lamp_g = [0] * LAMP_COUNT
-            lamp_b = [0] * LAMP_COUNT
-
-            for idx in range(LAMP_COUNT):
-                if random.random() < 0.18:
-                    delta = random.uniform(-0.18, 0.18)
-                    cin_lamp_target[idx] = max(0.4, min(1.4, cin_lamp_target[idx] + delta))
-                cin_lamp_level[idx] += (cin_lamp_target[idx] - cin_lamp_level[idx]) * 0.22
-
-                k_base = cin_temps[idx]
-                k_jitter = random.gauss(0.0, 90.0)
-                k = max(1800.0, min(2600.0, k_base + k_jitter))
-                r, g, b = _kelvin_to_rgb(k)
-
-                lamp_r[idx] = r
-                lamp_g[idx] = g
-                lamp_b[idx] = b
-
-            radius = 0.4 / float(LAMP_COUNT)
-            gamma = 2.2
-            floor = 0.03
-
-            for i in range(NUM_LEDS):
-                if NUM_LEDS > 1:
-                    gpos = i / float(NUM_LEDS - 1)
-                else:
-                    gpos = 0.5
-
-                best_idx = -1
-                best_w = 0.0
-                for idx, center in enumerate(cin_centers):
-                    d = abs(gpos - center)
-                    if d >= radius:
-                        continue
-                    w = 1.0 - d / radius
-                    w = w ** gamma
-                    if w > best_w:
-                        best_w = w
-                        best_idx = idx
-
-                if best_idx == -1:
-                    pixels[i] = (0, 0, 0)
-                else:
-                    lamp_base = cin_lamp_level[best_idx] * surge_scale
-                    lamp_base = max(0.4, min(1.3, lamp_base))
-
-                    if NUM_LEDS > 1:
-                        global_profile = global_dark + (1.0 - global_dark) * (1.0 - min(1.0, abs(gpos - 0.5) * 2.0))
+def _animation_loop():
+    global _render_errors
+    frame = new_frame(NUM_LEDS)
+    fade = Transition(NUM_LEDS)
+    correction = Correction(NUM_LEDS, GAMMA, WHITE, _state.brightness, DITHER)
+    redraw = False
+    effects = {}
+    # effects that were init()ed and not yet closed; one stays open while a
+    # fade is still rendering it as the outgoing side
+    live = set()
+    effect = None
+    mode = None
+    color = None
+    generation = -1
+    _mark("loop_started")
+    _open_output()
+    scheduler.reset()
+
+    while not _stopping.is_set():
+        state = _state
+        try:
+            if state.generation != generation:
+                generation = state.generation
+                if state.brightness != correction.brightness:
+                    correction.set_brightness(state.brightness)
+                    redraw = True
+                if state.mode != mode:
+                    outgoing = effect
+                    effect = effects.get(state.mode)
+                    if effect is None:
+                        effect = create_effect(state.mode, NUM_LEDS, LAMP_COUNT)
+                        if effect is not None:
+                            effects[state.mode] = effect
+                    if effect is not None:
+                        effect.init(state.color)
+                        live.add(effect)
+                    if state.transition is not None and effect is not None and mode is not None:
+                        # a fade interrupted by another change continues from the
+                        # blended frame instead of jumping back to either effect
+                        duration, curve = state.transition
+                        fade.start(frame, None if fade.active else outgoing, duration, curve, time.monotonic())
                     else:
-                        global_profile = global_dark
-
-                    glitch = 1.0
-                    if random.random() < 0.04:
-                        glitch = random.uniform(0.4, 1.5)
-
-                    s = floor + (1.0 - floor) * best_w
-                    s = s * lamp_base * global_profile * glitch
-
-                    r = int(max(0, min(255, lamp_r[best_idx] * s)))
-                    g = int(max(0, min(255, lamp_g[best_idx] * s * 0.75)))
-                    b = int(max(0, min(255, lamp_b[best_idx] * s * 0.3)))
-                    pixels[i] = (r, g, b)
-
-            pixels.show()
-            sleep_ms = random.randint(45, 70)
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "alert":
-            if not IS_PI or pixels is None:
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            phase += 0.12
-            level = (math.sin(phase) + 1.0) / 2.0
-            level = level * level
-            r = int(255 * level)
-            g = 0
-            b = 0
-
-            for i in range(NUM_LEDS):
-                pixels[i] = (r, g, b)
-
-            pixels.show()
-            sleep_ms = 40
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "water":
-            if not IS_PI or pixels is None:
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            t = time.time()
-            num_pixels = NUM_LEDS
-            if num_pixels <= 1:
-                pixels.show()
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            base_brightness = 0.15
-            caustic_strength = 0.85
-
-            freq1 = 1.2
-            freq2 = 2.7
-            freq3 = 7.5
-
-            speed1 = 0.04
-            speed2 = -0.07
-            speed3 = 0.18
-
-            for i in range(num_pixels):
-                x = i / float(num_pixels - 1)
-
-                w1 = math.sin(2 * math.pi * (freq1 * x - speed1 * t))
-                w2 = math.sin(2 * math.pi * (freq2 * x - speed2 * t))
-                w3 = 0.4 * math.sin(2 * math.pi * (freq3 * x - speed3 * t))
-
-                w = (w1 + w2 + w3) / 2.4
-                intensity = (w * 0.5 + 0.5)
-                intensity = intensity * intensity
-                intensity += random.uniform(-0.03, 0.03)
-                intensity = max(0.0, min(1.0, intensity))
-
-                brightness = base_brightness + caustic_strength * intensity
-                brightness = max(0.0, min(1.0, brightness))
-
-                r_base, g_base, b_base = 0, 20, 80
-                r_hi, g_hi, b_hi = 10, 180, 255
-
-                r = int(r_base + (r_hi - r_base) * intensity)
-                g = int(g_base + (g_hi - g_base) * intensity)
-                b = int(b_base + (b_hi - b_base) * intensity)
-
-                r = int(r * brightness)
-                g = int(g * brightness)
-                b = int(b * brightness)
-
-                pixels[i] = (r, g, b)
-
-            pixels.show()
-            sleep_ms = 20
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "cove_warm":
-            target_r, target_g, target_b = _kelvin_to_rgb(3200)
-
-            if not IS_PI or pixels is None:
-                last_mode = mode
-                last_color = color
-                time.sleep(0.04)
-                continue
-
-            if mode != last_mode:
-                phase = 0
-
-            if phase < 100:
-                phase += 1
-                a = phase / 100.0
-                a = a * a * (3.0 - 2.0 * a)
-
-                r = int(target_r * a)
-                g = int(target_g * a)
-                b = int(target_b * a)
-
-                for i in range(NUM_LEDS):
-                    pixels[i] = (r, g, b)
-                pixels.show()
-
-                sleep_ms = 25
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            for i in range(NUM_LEDS):
-                pixels[i] = (target_r, target_g, target_b)
-            pixels.show()
-
-            sleep_ms = 80
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-        
-        elif mode == "cove_warm_test":
-            target_r, target_g, target_b = _kelvin_to_rgb(2600)
-
-            if not IS_PI or pixels is None:
-                last_mode = mode
-                last_color = color
-                time.sleep(0.04)
-                continue
-
-            if mode != last_mode:
-                phase = 0
-
-            if phase < 100:
-                phase += 1
-                a = phase / 100.0
-                a = a * a * (3.0 - 2.0 * a)
-                a = a ** 2.2
-
-                r = int(target_r * a)
-                g = int(target_g * a)
-                b = int(target_b * a)
-
-                for i in range(NUM_LEDS):
-                    pixels[i] = (r, g, b)
-                pixels.show()
-
-                sleep_ms = 25
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            for i in range(NUM_LEDS):
-                pixels[i] = (target_r, target_g, target_b)
-            pixels.show()
-
-            sleep_ms = 80
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "aurora":
-            if not IS_PI or pixels is None:
-                time.sleep(0.03)
-                last_mode = mode
-                last_color = color
-                continue
-
-            t = time.time()
-            n = NUM_LEDS
-
-            st = globals().get("_aurora_clean")
-            if st is None or mode != last_mode or st.get("n") != n:
-                st = {
-                    "n": n,
-                    "t0": t,
-                    "speed": random.uniform(0.06, 0.10),
-                    "warp": random.uniform(0.15, 0.25),
-                    "bend": random.uniform(0.6, 1.0),
-                    "hue_shift": random.uniform(0.0, 1.0),
-                }
-                globals()["_aurora_clean"] = st
-
-            dt = t - st["t0"]
-            st["t0"] = t
-
-            base_speed = st["speed"]
-            warp = st["warp"]
-            bend = st["bend"]
-
-            for i in range(n):
-                x = i / (n - 1)
-
-                curtain = (
-                    0.5
-                    + 0.35 * math.sin(2 * math.pi * (1.1 * x - base_speed * t))
-                    + 0.15 * math.sin(2 * math.pi * (0.5 * x - 0.4 * base_speed * t))
-                )
-                curtain = max(0.0, min(1.0, curtain))
-
-                ripple = 0.5 + 0.5 * math.sin(
-                    2 * math.pi * (3.5 * x - 1.8 * base_speed * t + bend * curtain)
-                )
-                ripple = 0.75 + 0.25 * ripple
-
-                intensity = (0.25 + 0.75 * curtain) * ripple
-
-                hue = (
-                    0.35
-                    + 0.45 * math.sin(2 * math.pi * (0.15 * x - 0.12 * t))
-                    + 0.10 * math.sin(2 * math.pi * (0.05 * x + 0.07 * t))
-                )
-                hue = (hue + st["hue_shift"]) % 1.0
-
-                sat = 0.85
-                val = min(1.0, intensity)
-
-                r, g, b = _hsv_to_rgb(hue, sat, val)
-
-                pixels[i] = (
-                    int(r * 255),
-                    int(g * 255),
-                    int(b * 255),
-                )
-
-            pixels.show()
-            time.sleep(0.03)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "test":
-            if not IS_PI or pixels is None:
-                sleep_ms = 40
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
-                continue
-
-            if not test_initialized:
-                test_initialized = True
-                test_start = time.time()
-
-            elapsed = time.time() - test_start
-
-            if elapsed >= test_duration:
-                with _lock:
-                    target_mode = prev_mode if prev_mode is not None else "off"
-                    target_color = prev_color if prev_color is not None else (0, 0, 0)
-                    current_mode = target_mode
-                    current_color = target_color
-                test_initialized = False
-                sleep_ms = 10
-                time.sleep(sleep_ms / 1000.0)
-                last_mode = mode
-                last_color = color
+                        fade.stop()
+                    scheduler.reset()
+                elif state.color != color and effect is not None:
+                    effect.set_color(state.color)
+                    if state.transition is not None:
+                        # colour fade: blend from what is on the strip now
+                        duration, curve = state.transition
+                        fade.start(frame, None, duration, curve, time.monotonic())
+
+                mode = state.mode
+                color = state.color
+
+            if effect is None:
+                scheduler.wait(0.03)
                 continue
 
-            phase = elapsed / test_duration
-            level = math.sin(math.pi * phase)
-            if level < 0.0:
-                level = 0.0
-
-            r = int(255 * level)
-            g = int(255 * level)
-            b = int(255 * level)
-
-            for i in range(NUM_LEDS):
-                pixels[i] = (r, g, b)
-
-            pixels.show()
-            sleep_ms = 20
-            time.sleep(sleep_ms / 1000.0)
-            last_mode = mode
-            last_color = color
-            continue
-
-        elif mode == "off":
-            if mode != last_mode:
-                if IS_PI and pixels is not None:
-                    for i in range(NUM_LEDS):
-                        pixels[i] = (0, 0, 0)
-                    pixels.show()
-
-        last_mode = mode
-        last_color = color
-        time.sleep(sleep_ms / 1000.0)
-
+            if output is not None:
+                t0 = time.monotonic()
+                if fade.active:
+                    drawn = fade.render(frame, effect, time.time(), t0)
+                else:
+                    drawn = effect.render(frame, time.time())
+                if drawn or redraw:
+                    redraw = False
+                    sent = power.apply(correction.apply(frame))
+                    t1 = time.monotonic()
+                    output.push(sent)
+                    scheduler.record(t1 - t0, time.monotonic() - t1)
+                    if framebus is None and startup["first_frame"] is None:
+                        # the frame bus is only set up once the first frame is out
+                        _mark("first_frame")
+                        _open_framebus()
+                    if framebus is not None:
+                        framebus.publish(sent)
+                    if startup["first_lit"] is None and sent.any():
+                        _mark("first_lit")
+
+                if effect.done:
+                    _finish_test(state)
+
+            for stale in [e for e in live if e is not effect and e is not fade.outgoing]:
+                live.discard(stale)
+                stale.close()
+
+            delay = fade.next_delay(effect) if fade.active else effect.next_delay()
+            scheduler.wait(scheduler.period(mode, delay))
+        except Exception as e:
+            # one broken effect must not stop rendering for good: drop it and
+            # wait for the next command
+            _render_errors += 1
+            print(f"Render error in mode {state.mode!r}: {e!r}")
+            effects.pop(state.mode, None)
+            effect = None
+            mode = None
+            fade.stop()
+            for stale in live:
+                stale.close()
+            live.clear()
+            scheduler.wait(0.03)
+
+    for stale in live:
+        stale.close()
+    _blank()
+
+
+def _render_commands(commands):
+    global _state
+    while True:
+        msg = commands.get()
+        if isinstance(msg, State):
+            _state = msg
+            scheduler.interrupt()
+        elif msg[0] == "fps":
+            scheduler.set_target_fps(msg[1], msg[2])
+        elif msg[0] == "metrics":
+            _from_render.put(("metrics", _local_metrics()))
+        elif msg[0] == "stop":
+            _stopping.set()
+            scheduler.interrupt()
+
+def _render_process_main(commands, replies):
+    global _in_render_process, _from_render
+    _in_render_process = True
+    _from_render = replies
+    threading.Thread(target=_render_commands, args=(commands,), daemon=True).start()
+    _animation_loop()
+
+def _render_replies(replies):
+    while True:
+        msg = replies.get()
+        if msg[0] == "finish_test":
+            _restore_after_test(msg[1])
+        elif msg[0] == "metrics":
+            _metrics_replies.put(msg[1])
+        elif msg[0] == "mark":
+            _mark(msg[1], msg[2])
+
+def _stop_render_process():
+    proc = _render_proc
+    if proc is not None and proc.is_alive():
+        proc.terminate()
+        proc.join(1.0)
+    if FRAMEBUS_NAME:
+        from framebus import unlink
+        unlink(FRAMEBUS_NAME)
+
+def _start_render_process():
+    global _render_proc, _to_render, _from_render, _frame_reader
+    if _render_proc is None:
+        atexit.register(_stop_render_process)
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")
+    commands = ctx.Queue()
+    replies = ctx.Queue()
+    proc = ctx.Process(target=_render_process_main, args=(commands, replies), name="trulight-render", daemon=True)
+    proc.start()
+
+    with _write_lock:
+        commands.put(_state)
+        for fps_mode, fps in scheduler.target_fps.items():
+            commands.put(("fps", fps_mode, fps))
+        _to_render = commands
+    _from_render = replies
+    _render_proc = proc
+    _frame_reader = None
+    threading.Thread(target=_render_replies, args=(replies,), daemon=True).start()
+
+def _loop_alive():
+    if _render_proc is not None:
+        return _render_proc.is_alive()
+    return _loop_thread is not None and _loop_thread.is_alive()
 
 def _ensure_loop():
-    global _loop_started
-    if _loop_started:
+    global _loop_started, _loop_thread
+    if _stopping.is_set() or _loop_started and _loop_alive():
         return
-    t = threading.Thread(target=_animation_loop, daemon=True)
-    t.start()
-    _loop_started = True
 
-def set_color(r, g, b):
-    global current_color, current_mode
+    with _start_lock:
+        if RENDER_PROCESS:
+            if _render_proc is None or not _render_proc.is_alive():
+                _start_render_process()
+        elif _loop_thread is None or not _loop_thread.is_alive():
+            _loop_thread = threading.Thread(target=_animation_loop, name="render", daemon=True)
+            _loop_thread.start()
+        _loop_started = True
+
+def resume():
+    # called once the server is up: the render loop starts in the background
+    # and opens the driver itself, so the saved scene (or a dark strip) is
+    # showing before the first request instead of after it
+    _mark("ready")
+    if strips:
+        _ensure_loop()
+    if cues.load():
+        cues.start()
+    return _restored
+
+def shutdown(timeout=2.0):
+    # stop rendering, blank the strip and write out anything still pending
+    _stopping.set()
+    if _render_proc is not None:
+        if _render_proc.is_alive():
+            _to_render.put(("stop",))
+            _render_proc.join(timeout)
+        _stop_render_process()
+    elif _loop_thread is not None:
+        scheduler.interrupt()
+        _loop_thread.join(timeout)
+    audio.release_input(force=True)
+    if _store is not None:
+        _store.flush()
+    if cues.store is not None:
+        cues.store.flush()
+
+def get_startup():
+    return dict(startup)
+
+def set_color(r, g, b, transition=None):
+    _, ((r, g, b), transition) = _parse_op("set_color", {"r": r, "g": g, "b": b, "transition": transition})
     _ensure_loop()
 
-    if not IS_PI or pixels is None:
+    if not strips:
         print(f"Simulated LED color: ({r}, {g}, {b})")
         return {"simulated": True, "r": r, "g": g, "b": b}
 
-    with _lock:
-        current_color = (r, g, b)
-        current_mode = "static"
+    with _write_lock:
+        _publish(mode="static", color=(r, g, b), transition=transition)
 
-    return {"simulated": False, "r": r, "g": g, "b": b}
+    return {"simulated": not IS_PI, "r": r, "g": g, "b": b}
 
-def _kelvin_to_rgb(k):
-    k = k / 100.0
-
-    if k <= 66:
-        r = 255
-    else:
-        r = 329.698727446 * ((k - 60) ** -0.1332047592)
-        r = max(0, min(255, r))
+def set_mode(mode, transition=None):
+    _, (mode, transition) = _parse_op("set_mode", {"mode": mode, "transition": transition})
+    _ensure_loop()
 
-    if k <= 66:
-        g = 99.4708025861 * math.log(k) - 161.1195681661
-    else:
-        g = 288.1221695283 * ((k - 60) ** -0.0755148492)
-    g = max(0, min(255, g))
+    if not strips:
+        return {"simulated": True, "mode": mode}
 
-    if k >= 66:
-        b = 255
-    elif k <= 19:
-        b = 0
-    else:
-        b = 138.5177312231 * math.log(k - 10) - 305.0447927307
-    b = max(0, min(255, b))
-
-    return (int(r), int(g), int(b))
-
-def _hsv_to_rgb(h, s, v):
-    h = h % 1.0
-    i = int(h * 6.0)
-    f = (h * 6.0) - i
-    p = v * (1.0 - s)
-    q = v * (1.0 - f * s)
-    t = v * (1.0 - (1.0 - f) * s)
-    i = i % 6
-
-    if i == 0:
-        r, g, b = v, t, p
-    elif i == 1:
-        r, g, b = q, v, p
-    elif i == 2:
-        r, g, b = p, v, t
-    elif i == 3:
-        r, g, b = p, q, v
-    elif i == 4:
-        r, g, b = t, p, v
-    else:
-        r, g, b = v, p, q
+    with _write_lock:
+        if mode == "test" and _state.mode != "test":
+            _publish(mode=mode, transition=transition, prev_mode=_state.mode, prev_color=_state.color)
+        else:
+            _publish(mode=mode, transition=transition)
 
-    return r, g, b
+    return {"simulated": not IS_PI, "mode": "unassigned"}
 
-def set_mode(mode):
-    global current_mode, prev_color, prev_mode
+def set_brightness(level):
+    level = _parse_brightness(level)
     _ensure_loop()
 
-    if not IS_PI or pixels is None:
-        return {"simulated": True, "mode": mode}
-
-    with _lock:
-        if mode == "test":
-            prev_mode = current_mode
-            prev_color = current_color
-
-        current_mode = mode
+    if not strips:
+        return {"simulated": True, "brightness": level}
+
+    with _write_lock:
+        _publish(brightness=level)
+
+    return {"simulated": not IS_PI, "brightness": level}
+
+def _parse_brightness(level):
+    try:
+        level = float(level)
+    except (TypeError, ValueError):
+        raise ValueError("brightness must be a number")
+    if not 0.0 <= level <= 1.0:
+        raise ValueError("brightness must be 0-1")
+    return level
+
+def _parse_op(action, payload):
+    if action == "set_color":
+        try:
+            color = tuple(int(payload[k]) for k in ("r", "g", "b"))
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError("set_color needs integer r, g and b")
+        if not all(0 <= c <= 255 for c in color):
+            raise ValueError("set_color values must be 0-255")
+        return "color", (color, parse_spec(payload.get("transition")))
+
+    if action == "set_mode":
+        mode = payload.get("mode")
+        if not mode_exists(mode):
+            raise ValueError(f"Unknown mode {mode!r}")
+        return "mode", (mode, parse_spec(payload.get("transition")))
+
+    if action == "set_brightness":
+        return "brightness", _parse_brightness(payload.get("brightness"))
+
+    raise ValueError(f"Unknown action {action!r}")
+
+def validate_op(action, payload):
+    # the checks the setters and apply_batch use, for front ends that reject
+    # a message before queueing it; returns the parsed value
+    return _parse_op(action, payload)[1]
+
+def apply_batch(ops):
+    # ops is a list of (action, payload). Everything is validated first and
+    # then published as one State, so the animation loop sees either the old
+    # state or the final one, never a half-applied scene.
+    changes = [_parse_op(action, payload or {}) for action, payload in ops]
+    _ensure_loop()
 
-    return {"simulated": False, "mode": "unassigned"}
+    with _write_lock:
+        mode, color, transition = _state.mode, _state.color, None
+        brightness = _state.brightness
+        saved_mode, saved_color = _state.prev_mode, _state.prev_color
+        for kind, value in changes:
+            if kind == "color":
+                color, transition = value
+                mode = "static"
+            elif kind == "brightness":
+                brightness = value
+            else:
+                value, transition = value
+                if value == "test" and mode != "test":
+                    saved_mode, saved_color = mode, color
+                mode = value
+
+        _publish(
+            mode=mode, color=color, transition=transition, brightness=brightness,
+            prev_mode=saved_mode, prev_color=saved_color,
+        )
+
+    state = get_state()
+    state["simulated"] = not strips or not IS_PI
+    return state
+
+# Scheduled scenes (see cues.py). The queue is kept next to the state file.
+CUE_FILE = os.environ.get(
+    "TRULIGHT_CUE_FILE", os.path.join(os.path.dirname(STATE_FILE), "cues.json") if STATE_FILE else "",
+)
+
+def _fire_cue(cue):
+    apply_batch([(op["action"], op.get("payload")) for op in cue.ops])
+
+cues = CueScheduler(_fire_cue, StateStore(CUE_FILE, delay=0.2) if CUE_FILE else None)
+if cues.store is not None:
+    atexit.register(cues.store.flush)
+
+def _check_ops(ops):
+    ops = [{"action": action, "payload": payload or {}} for action, payload in ops]
+    if not ops:
+        raise ValueError("a cue needs at least one op")
+    for op in ops:
+        _parse_op(op["action"], op["payload"])
+    return ops
+
+def _seconds(value, name, low=0.0, high=MAX_AHEAD):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not (math.isfinite(value) and low <= value <= high):
+        raise ValueError(f"{name} must be {low:g}-{high:g} seconds")
+    return value
+
+def _cue_time(at, after):
+    if at is not None and after is not None:
+        raise ValueError("give either at or after, not both")
+    now = time.time()
+    if at is not None:
+        at = float(at)
+        if not (math.isfinite(at) and at <= now + MAX_AHEAD):
+            raise ValueError("at must be a Unix time at most a year ahead")
+        return at
+    return now + _seconds(after or 0.0, "after")
+
+def _check_repeat(repeat):
+    if repeat is None:
+        return None
+    return _seconds(repeat, "repeat", MIN_REPEAT)
+
+def add_cue(ops, at=None, after=None, repeat=None):
+    # ops as for apply_batch; at is a Unix time, after is seconds from now
+    cue = cues.add(_cue_time(at, after), _check_ops(ops), _check_repeat(repeat))
+    cues.start()
+    return cue.to_dict()
+
+def add_timeline(keyframes, at=None, after=None, repeat=None):
+    # keyframes: [(offset_seconds, ops)]
+    frames = []
+    for offset, ops in keyframes:
+        frames.append((_seconds(offset, "keyframe offset"), _check_ops(ops)))
+    if not frames:
+        raise ValueError("a timeline needs at least one keyframe")
+    timeline, added = cues.add_timeline(_cue_time(at, after), frames, _check_repeat(repeat))
+    cues.start()
+    return {"timeline": timeline, "cues": [c.to_dict() for c in added]}
+
+def list_cues():
+    return cues.list()
+
+def cancel_cue(cue_id):
+    return cues.cancel(cue_id)
+
+def get_state():
+    state = _state
+    return {
+        "mode": state.mode, "color": list(state.color), "brightness": state.brightness,
+        "generation": state.generation,
+    }
+
+def get_frame_reader():
+    # attaches lazily: the ring only exists once the render loop has started
+    global _frame_reader
+    from framebus import FrameBusReader
+    if _frame_reader is None and framebus is not None:
+        _frame_reader = FrameBusReader(framebus.shm)
+    elif _frame_reader is None and FRAMEBUS_NAME:
+        _frame_reader = FrameBusReader.attach(FRAMEBUS_NAME)
+    return _frame_reader
+
+def bake_clip(mode, seconds=10.0, fps=40.0, seed=0):
+    # runs in the caller's thread; the render loop keeps going meanwhile
+    clip = clips.bake(mode, NUM_LEDS, LAMP_COUNT, seconds, fps, seed)
+    return clip.info()
+
+def list_clips():
+    return [clip.info() for clip in clips.list_clips()]
+
+def set_target_fps(mode, fps):
+    if not mode_exists(mode):
+        raise ValueError(f"Unknown mode {mode!r}")
+    fps = parse_fps(fps)
+    scheduler.set_target_fps(mode, fps)
+    if _to_render is not None:
+        _to_render.put(("fps", mode, fps))
+    with _write_lock:
+        _persist()
+    return {"mode": mode, "fps": scheduler.target_fps.get(mode)}
+
+def get_metrics():
+    if _to_render is None:
+        return _local_metrics()
+
+    with _metrics_lock:
+        while not _metrics_replies.empty():
+            _metrics_replies.get_nowait()
+        _to_render.put(("metrics",))
+        try:
+            stats = _metrics_replies.get(timeout=1.0)
+        except queue.Empty:
+            stats = {"error": "render process did not answer"}
+    stats["mode"] = _state.mode
+    stats["render_pid"] = _render_proc.pid if _render_proc is not None else None
+    stats["startup"] = dict(startup)
+    if _store is not None:
+        stats["persist"] = _store.stats()
+    stats["cues"] = cues.stats()
+    return stats
+
+def _local_metrics():
+    stats = frame_stats.snapshot()
+    stats["mode"] = _state.mode
+    stats["output"] = output.stats() if output is not None else None
+    stats["target_fps"] = dict(scheduler.target_fps)
+    stats["render_errors"] = _render_errors
+    stats["power"] = power.stats()
+    stats["startup"] = dict(startup)
+    stats["audio"] = audio.stats()
+    if _store is not None:
+        stats["persist"] = _store.stats()
+    stats["cues"] = cues.stats()
+    return stats
+
+_restore()
+_mark("imported")
@@ -0,0 +1,149 @@
+import math
+
+import numpy as np
+
+# Lookup tables built once at import so effects never call log/pow or do the
+# HSV sector dance per frame. kelvin_to_rgb/hsv_to_rgb stay as the reference
+# implementations the tables are built from and checked against.
+#
+# Measured against the reference functions:
+#   kelvin_lut:  1 K steps over 1000-40000 K, nearest entry. Integer inputs
+#                are exact; fractional inputs are off by at most 1 per
+#                channel, except within 0.5 K of 6600 K where the reference
+#                itself jumps by 4 between its two branches.
+#   hsv_lut:     4096 hue steps, exact in s and v (every channel is
+#                v * (1 - s * w(h))). Max abs error 0.0008, i.e. at most 1
+#                step once scaled to 0-255 and truncated.
+
+KELVIN_MIN = 1000
+KELVIN_MAX = 40000
+KELVIN_STEP = 1
+HUE_STEPS = 4096
+
+
+def kelvin_to_rgb(k):
+    k = k / 100.0
+
+    if k <= 66:
+        r = 255
+    else:
+        r = 329.698727446 * ((k - 60) ** -0.1332047592)
+        r = max(0, min(255, r))
+
+    if k <= 66:
+        g = 99.4708025861 * math.log(k) - 161.1195681661
+    else:
+        g = 288.1221695283 * ((k - 60) ** -0.0755148492)
+    g = max(0, min(255, g))
+
+    if k >= 66:
+        b = 255
+    elif k <= 19:
+        b = 0
+    else:
+        b = 138.5177312231 * math.log(k - 10) - 305.0447927307
+    b = max(0, min(255, b))
+
+    return (int(r), int(g), int(b))
+
+
+def hsv_to_rgb(h, s, v):
+    h = h % 1.0
+    i = int(h * 6.0)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - f * s)
+    t = v * (1.0 - (1.0 - f) * s)
+    i = i % 6
+
+    if i == 0:
+        r, g, b = v, t, p
+    elif i == 1:
+        r, g, b = q, v, p
+    elif i == 2:
+        r, g, b = p, v, t
+    elif i == 3:
+        r, g, b = p, q, v
+    elif i == 4:
+        r, g, b = t, p, v
+    else:
+        r, g, b = v, p, q
+
+    return r, g, b
+
+
+def _build_kelvin_table():
+    k = np.arange(KELVIN_MIN, KELVIN_MAX + 1, KELVIN_STEP, dtype=np.float64) / 100.0
+    warm = k <= 66
+    hot = np.maximum(k - 60, 1e-9)
+
+    r = np.where(warm, 255.0, 329.698727446 * hot ** -0.1332047592)
+    g = np.where(warm, 99.4708025861 * np.log(k) - 161.1195681661, 288.1221695283 * hot ** -0.0755148492)
+    b = np.where(
+        k >= 66,
+        255.0,
+        np.where(k <= 19, 0.0, 138.5177312231 * np.log(np.maximum(k - 10, 1e-9)) - 305.0447927307),
+    )
+
+    table = np.clip(np.stack([r, g, b], axis=1), 0.0, 255.0).astype(np.uint8)
+    table.flags.writeable = False
+    return table
+
+
+def _build_hue_table():
+    # weight of s for each channel: channel = v * (1 - s * w)
+    h6 = np.arange(HUE_STEPS, dtype=np.float64) * (6.0 / HUE_STEPS)
+    i = h6.astype(np.int64) % 6
+    f = h6 - np.floor(h6)
+    zero = np.zeros_like(f)
+    one = np.ones_like(f)
+    rise = 1.0 - f
+
+    w_r = np.choose(i, (zero, f, one, one, rise, zero))
+    w_g = np.choose(i, (rise, zero, zero, f, one, one))
+    w_b = np.choose(i, (one, one, rise, zero, zero, f))
+
+    table = np.stack([w_r, w_g, w_b], axis=1)
+    table.flags.writeable = False
+    return table
+
+
+KELVIN_TABLE = _build_kelvin_table()
+HUE_TABLE = _build_hue_table()
+
+
+def _kelvin_index(k):
+    i = int(round((k - KELVIN_MIN) / KELVIN_STEP))
+    return min(max(i, 0), len(KELVIN_TABLE) - 1)
+
+
+def kelvin_lut(k):
+    r, g, b = KELVIN_TABLE[_kelvin_index(k)]
+    return (int(r), int(g), int(b))
+
+
+def kelvin_lut_array(k, out=None):
+    idx = np.rint((np.asarray(k, dtype=np.float64) - KELVIN_MIN) / KELVIN_STEP).astype(np.intp)
+    np.clip(idx, 0, len(KELVIN_TABLE) - 1, out=idx)
+    return np.take(KELVIN_TABLE, idx, axis=0, out=out)
+
+
+def hsv_lut(h, s, v):
+    w = HUE_TABLE[int((h % 1.0) * HUE_STEPS + 0.5) % HUE_STEPS]
+    return (
+        v * (1.0 - s * float(w[0])),
+        v * (1.0 - s * float(w[1])),
+        v * (1.0 - s * float(w[2])),
+    )
+
+
+def hsv_lut_array(h, s, v):
+    # returns an (N, 3) float array in 0..1
+    idx = np.rint(np.mod(h, 1.0) * HUE_STEPS).astype(np.intp)
+    idx %= HUE_STEPS
+    s = np.asarray(s, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    rgb = HUE_TABLE[idx] * -(s[..., None] if s.ndim else s)
+    rgb += 1.0
+    rgb *= v[..., None] if v.ndim else v
+    return rgb
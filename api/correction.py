@@ -0,0 +1,69 @@
+import numpy as np
+
+# Output correction applied once to every frame after the effect (and any
+# transition) has drawn it: per-channel gamma and white balance, master
+# brightness and temporal dithering, in one vectorized pass.
+#
+# Each channel has a 256-entry LUT holding the corrected level in 8.8 fixed
+# point. The fractional part that does not fit in 8 bits is carried to the
+# next frame for that pixel, so a dimmed fade averages out to the right level
+# over a few frames instead of stepping in whole LSBs.
+#
+# Effects keep their own tints: those are part of how a mode looks. This stage
+# only describes the strip (TRULIGHT_GAMMA, TRULIGHT_WHITE) and the room
+# (brightness).
+
+
+def parse_channels(text, default):
+    # "2.2" or "2.2,2.2,2.6" -> (r, g, b)
+    if not text:
+        return default
+    values = [float(v) for v in text.split(",")]
+    if len(values) == 1:
+        values *= 3
+    if len(values) != 3:
+        raise ValueError(f"expected one or three values, got {text!r}")
+    return tuple(values)
+
+
+def build_luts(gamma=(1.0, 1.0, 1.0), white=(1.0, 1.0, 1.0), brightness=1.0):
+    x = np.arange(256) / 255.0
+    luts = np.empty((3, 256), dtype=np.uint16)
+    for c in range(3):
+        level = x ** gamma[c] * (white[c] * brightness)
+        luts[c] = np.clip(np.rint(level * 255.0 * 256.0), 0, 255 * 256)
+    return luts
+
+
+class Correction:
+    def __init__(self, num_leds, gamma=(1.0, 1.0, 1.0), white=(1.0, 1.0, 1.0), brightness=1.0, dither=True):
+        self.gamma = gamma
+        self.white = white
+        self.dither = dither
+        self.offsets = np.arange(3) * 256
+        self.index = np.zeros((num_leds, 3), dtype=np.intp)
+        self.acc = np.zeros((num_leds, 3), dtype=np.uint16)
+        self.error = np.zeros((num_leds, 3), dtype=np.uint16)
+        self.out = np.zeros((num_leds, 3), dtype=np.uint8)
+        self.set_brightness(brightness)
+
+    def set_brightness(self, brightness):
+        self.brightness = brightness
+        self.lut = build_luts(self.gamma, self.white, brightness).reshape(-1)
+        # with an identity LUT the frame goes out untouched
+        self.identity = np.array_equal(self.lut, np.tile(np.arange(256, dtype=np.uint16) << 8, 3))
+
+    def apply(self, frame):
+        # returns the frame to send; frame itself is left as the effect drew it
+        if self.identity:
+            return frame
+        np.add(frame, self.offsets, out=self.index)
+        np.take(self.lut, self.index, out=self.acc)
+        if self.dither:
+            self.acc += self.error
+            np.bitwise_and(self.acc, 0xFF, out=self.error)
+        else:
+            self.acc += 128
+        np.right_shift(self.acc, 8, out=self.acc)
+        np.copyto(self.out, self.acc, casting="unsafe")
+        return self.out
@@ -0,0 +1,182 @@
+import heapq
+import math
+import threading
+import time
+import uuid
+
+# Timed scenes. A cue is a list of batch ops ({"action", "payload"}) applied
+# atomically at a wall-clock time, optionally repeating every `repeat`
+# seconds. A timeline is a group of cues at offsets from a common start that
+# can be cancelled together. Colour fades are just set_color ops with a
+# "transition".
+#
+# One thread sleeps on a Condition until the earliest cue in a heap is due,
+# so there is no polling; adding or cancelling a cue wakes it to re-check the
+# head. The fire callback publishes the new state and interrupts the render
+# loop's frame wait, so a cue reaches the strip within a millisecond or two
+# instead of on the next frame boundary.
+
+MISSED_GRACE = 60.0  # one-shot cues this late after a restart still fire
+MAX_AHEAD = 366 * 86400.0  # furthest a cue, offset or repeat may reach
+MIN_REPEAT = 1.0
+MAX_WAIT = 3600.0  # the thread re-checks the heap at least this often
+
+
+def valid_repeat(repeat):
+    return repeat is None or (math.isfinite(repeat) and MIN_REPEAT <= repeat <= MAX_AHEAD)
+
+
+class Cue:
+    def __init__(self, at, ops, repeat=None, timeline=None, offset=None, cue_id=None):
+        self.id = cue_id or uuid.uuid4().hex[:12]
+        self.at = at
+        self.ops = ops
+        self.repeat = repeat
+        self.timeline = timeline
+        self.offset = offset
+
+    def to_dict(self):
+        return {
+            "id": self.id, "at": self.at, "ops": self.ops, "repeat": self.repeat,
+            "timeline": self.timeline, "offset": self.offset,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            float(data["at"]), data["ops"], data.get("repeat"), data.get("timeline"),
+            data.get("offset"), data["id"],
+        )
+
+
+class CueScheduler:
+    def __init__(self, fire, store=None, clock=time.time):
+        self.fire = fire
+        self.store = store
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.heap = []
+        self.cues = {}
+        self.seq = 0
+        self.thread = None
+        self.fired = 0
+        self.failed = 0
+        self.late_max = 0.0
+        self.late_total = 0.0
+
+    def start(self):
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="cues", daemon=True)
+                self.thread.start()
+
+    def load(self):
+        data = self.store.load() if self.store is not None else None
+        now = self.clock()
+        with self.cond:
+            for entry in (data or {}).get("cues", []):
+                try:
+                    cue = Cue.from_dict(entry)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if not (math.isfinite(cue.at) and cue.at <= now + MAX_AHEAD) or not valid_repeat(cue.repeat):
+                    continue
+                if cue.at < now - MISSED_GRACE:
+                    if not cue.repeat:
+                        continue
+                    cue.at += ((now - cue.at) // cue.repeat + 1) * cue.repeat
+                self._push(cue)
+        return len(self.cues)
+
+    def add(self, at, ops, repeat=None):
+        cue = Cue(at, ops, repeat)
+        with self.cond:
+            self._push(cue)
+            self._changed()
+        return cue
+
+    def add_timeline(self, start, keyframes, repeat=None):
+        # keyframes: [(offset_seconds, ops)]
+        timeline = uuid.uuid4().hex[:12]
+        cues = [Cue(start + offset, ops, repeat, timeline, offset) for offset, ops in keyframes]
+        with self.cond:
+            for cue in cues:
+                self._push(cue)
+            self._changed()
+        return timeline, cues
+
+    def cancel(self, cue_id):
+        # a cue id, or a timeline id to drop every cue in it
+        with self.cond:
+            doomed = [c.id for c in self.cues.values() if c.id == cue_id or c.timeline == cue_id]
+            for key in doomed:
+                del self.cues[key]
+            if doomed:
+                self._changed()
+        return len(doomed)
+
+    def list(self):
+        with self.cond:
+            cues = sorted(self.cues.values(), key=lambda c: c.at)
+        return [c.to_dict() for c in cues]
+
+    def stats(self):
+        return {
+            "pending": len(self.cues),
+            "fired": self.fired,
+            "failed": self.failed,
+            "late_ms_mean": round(self.late_total / self.fired * 1000.0, 3) if self.fired else None,
+            "late_ms_max": round(self.late_max * 1000.0, 3),
+        }
+
+    def _push(self, cue):
+        # caller holds cond; stale heap entries are skipped when popped
+        self.cues[cue.id] = cue
+        self.seq += 1
+        heapq.heappush(self.heap, (cue.at, self.seq, cue.id))
+
+    def _changed(self):
+        self.cond.notify()
+        if self.store is not None:
+            self.store.save({"cues": [c.to_dict() for c in self.cues.values()]})
+
+    def _next_due(self):
+        # caller holds cond; returns a due cue or how long to sleep
+        while self.heap:
+            at, _, cue_id = self.heap[0]
+            cue = self.cues.get(cue_id)
+            if cue is None or cue.at != at:
+                heapq.heappop(self.heap)
+                continue
+            delay = at - self.clock()
+            if delay > 0:
+                return None, delay
+            heapq.heappop(self.heap)
+            if cue.repeat:
+                cue.at += cue.repeat
+                self.seq += 1
+                heapq.heappush(self.heap, (cue.at, self.seq, cue.id))
+            else:
+                del self.cues[cue_id]
+            self._changed()
+            return (cue, at), 0.0
+        return None, None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                due, delay = self._next_due()
+                if due is None:
+                    self.cond.wait(None if delay is None else min(delay, MAX_WAIT))
+                    continue
+            cue, at = due
+            late = max(0.0, self.clock() - at)
+            try:
+                self.fire(cue)
+            except Exception as e:
+                self.failed += 1
+                print(f"Cue {cue.id} failed: {e}")
+                continue
+            self.fired += 1
+            self.late_total += late
+            self.late_max = max(self.late_max, late)
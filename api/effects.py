@@ -0,0 +1,425 @@
+import math
+
+import numpy as np
+
+from colors import kelvin_lut, kelvin_lut_array
+from noise import Noise
+from render import lamp_weights, positions, render_aurora, render_lamps, render_water
+
+EFFECTS = {}
+
+
+def register(cls):
+    EFFECTS[cls.name] = cls
+    return cls
+
+
+def _lookup(mode):
+    # "name:arg" modes hand arg to effects that take one (e.g. "clip:aurora")
+    name, _, arg = mode.partition(":")
+    cls = EFFECTS.get(name)
+    if cls is None or (arg and not cls.takes_arg):
+        return None, None
+    return cls, arg or None
+
+
+def mode_exists(mode):
+    return isinstance(mode, str) and _lookup(mode)[0] is not None
+
+
+def create_effect(mode, num_leds, lamp_count):
+    cls, arg = _lookup(mode)
+    if cls is None:
+        return None
+    if cls.takes_arg:
+        return cls(num_leds, lamp_count, arg)
+    return cls(num_leds, lamp_count)
+
+
+class Effect:
+    # render(frame, t) draws into the shared (N, 3) uint8 frame and returns
+    # True when the frame should be pushed to the strip. All per-frame state
+    # is allocated in __init__ and reset in init(), never in render().
+    # Randomness comes from self.noise; seed() makes a run reproducible.
+    # bakeable=False marks effects that depend on live input and cannot be
+    # pre-rendered into a clip.
+    name = None
+    delay = 0.03
+    takes_arg = False
+    bakeable = True
+
+    def __init__(self, num_leds, lamp_count):
+        self.num_leds = num_leds
+        self.lamp_count = lamp_count
+        self.color = (0, 0, 0)
+        self.done = False
+        self.noise = Noise()
+
+    def seed(self, seed):
+        self.noise.seed(seed)
+
+    def init(self, color):
+        self.color = color
+        self.done = False
+
+    def set_color(self, color):
+        self.color = color
+
+    def close(self):
+        # called when the effect stops being shown; frees anything init()
+        # acquired outside the effect (the audio capture, for one)
+        pass
+
+    def render(self, frame, t):
+        return False
+
+    def next_delay(self):
+        return self.delay
+
+
+@register
+class StaticEffect(Effect):
+    name = "static"
+
+    def init(self, color):
+        super().init(color)
+        self.dirty = True
+
+    def set_color(self, color):
+        super().set_color(color)
+        self.dirty = True
+
+    def render(self, frame, t):
+        if not self.dirty:
+            return False
+        frame[:] = self.color
+        self.dirty = False
+        return True
+
+
+@register
+class OffEffect(Effect):
+    name = "off"
+
+    def init(self, color):
+        super().init(color)
+        self.dirty = True
+
+    def render(self, frame, t):
+        if not self.dirty:
+            return False
+        frame[:] = 0
+        self.dirty = False
+        return True
+
+
+@register
+class FireEffect(Effect):
+    name = "fire"
+
+    base = np.array([255, 96, 12])
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        self.flicker = np.zeros(num_leds)
+        self.work = np.zeros((num_leds, 3))
+
+    def render(self, frame, t):
+        # flicker is a whole number 0-40 per pixel, taken off every channel
+        self.noise.uniform(0.0, 41.0, self.flicker)
+        np.floor(self.flicker, out=self.flicker)
+        np.subtract(self.base, self.flicker[:, None], out=self.work)
+        np.maximum(self.work, 0.0, out=self.work)
+        np.copyto(frame, self.work, casting="unsafe")
+        return True
+
+    def next_delay(self):
+        return self.noise.randint(50, 150) / 1000.0
+
+
+class LampEffect(Effect):
+    # a row of incandescent "lamps" that flicker and drift in colour temperature
+    level_range = (0.8, 1.0)
+    base_temp = 2200.0
+    temp_spread = 80.0
+    temp_jitter = 40.0
+    temp_range = (1900.0, 2600.0)
+    target_chance = 0.06
+    target_delta = 0.04
+    target_range = (0.75, 1.05)
+    follow = 0.18
+    scale_range = (0.7, 1.05)
+    surge_chance = 0.003
+    surge_frames = (10, 24)
+    surge_strength = (-0.25, 0.15)
+    radius = 0.55
+    gamma = 1.8
+    floor = 0.08
+    tint = (1.0, 1.0, 1.0)
+    delay_ms = (40, 55)
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        self.centers = [(idx + 0.5) / float(lamp_count) for idx in range(lamp_count)]
+        self.temps = self.base_temp + (np.arange(lamp_count) - (lamp_count - 1) / 2.0) * self.temp_spread
+        self.level = np.zeros(lamp_count)
+        self.target = np.zeros(lamp_count)
+        self.chance = np.zeros(lamp_count)
+        self.delta = np.zeros(lamp_count)
+        self.lamp_rgb = np.zeros((lamp_count, 3))
+        self.lamp_kelvin = np.zeros(lamp_count)
+        self.lamp_scale = np.zeros(lamp_count)
+        self.tint_arr = np.array(self.tint)
+        self.index, self.weight = lamp_weights(
+            num_leds, lamp_count, self.radius / float(max(1, lamp_count)), self.gamma, self.floor,
+        )
+        self.work = np.zeros((num_leds, 3))
+        self.surge_left = 0
+        self.surge_total = 0
+        self.surge_amount = 0.0
+
+    def init(self, color):
+        super().init(color)
+        self.noise.uniform(*self.level_range, self.level)
+        self.target[:] = self.level
+        self.surge_left = 0
+
+    def surge_scale(self):
+        if self.surge_left <= 0 and self.noise.random() < self.surge_chance:
+            self.surge_total = self.noise.randint(*self.surge_frames)
+            self.surge_left = self.surge_total
+            self.surge_amount = self.noise.uniform1(*self.surge_strength)
+
+        if self.surge_left > 0 and self.surge_total > 0:
+            progress = (self.surge_total - self.surge_left) / float(max(1, self.surge_total))
+            self.surge_left -= 1
+            return 1.0 + self.surge_amount * math.sin(progress * math.pi)
+        return 1.0
+
+    def update_lamps(self, scale):
+        # every lamp at once: a retarget roll, a drift and a temperature jitter
+        noise = self.noise
+        noise.uniform(0.0, 1.0, self.chance)
+        noise.uniform(-self.target_delta, self.target_delta, self.delta)
+        self.delta[self.chance >= self.target_chance] = 0.0
+        self.target += self.delta
+        np.clip(self.target, *self.target_range, out=self.target)
+        self.level += (self.target - self.level) * self.follow
+
+        noise.normal(self.temp_jitter, self.lamp_kelvin)
+        self.lamp_kelvin += self.temps
+        np.multiply(self.level, scale, out=self.lamp_scale)
+        np.clip(self.lamp_scale, *self.scale_range, out=self.lamp_scale)
+
+        np.clip(self.lamp_kelvin, *self.temp_range, out=self.lamp_kelvin)
+        self.lamp_rgb[:] = kelvin_lut_array(self.lamp_kelvin)
+
+    def lamp_scale_factor(self):
+        return self.surge_scale()
+
+    def pixel_scale(self):
+        return None
+
+    def render(self, frame, t):
+        if not self.centers:
+            return False
+        self.update_lamps(self.lamp_scale_factor())
+        render_lamps(
+            frame, self.index, self.weight, self.lamp_rgb, self.lamp_scale,
+            self.tint_arr, self.pixel_scale(), self.work,
+        )
+        return True
+
+    def next_delay(self):
+        if not self.centers:
+            return 0.04
+        return self.noise.randint(*self.delay_ms) / 1000.0
+
+
+@register
+class ErasEffect(LampEffect):
+    name = "eras"
+    tint = (1.0, 0.94, 0.7)
+
+    def init(self, color):
+        super().init(color)
+        self.buzz_phase = 0.0
+
+    def lamp_scale_factor(self):
+        self.buzz_phase += 0.25
+        mains_mod = 0.97 + 0.03 * math.sin(self.buzz_phase)
+        return mains_mod * self.surge_scale()
+
+
+@register
+class CinematicEffect(LampEffect):
+    name = "cinematic"
+    level_range = (0.8, 1.1)
+    base_temp = 2100.0
+    temp_spread = 120.0
+    temp_jitter = 90.0
+    temp_range = (1800.0, 2600.0)
+    target_chance = 0.18
+    target_delta = 0.18
+    target_range = (0.4, 1.4)
+    follow = 0.22
+    scale_range = (0.4, 1.3)
+    surge_chance = 0.015
+    surge_frames = (8, 20)
+    surge_strength = (-0.6, 0.4)
+    radius = 0.4
+    gamma = 2.2
+    floor = 0.03
+    tint = (1.0, 0.75, 0.3)
+    delay_ms = (45, 70)
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        if num_leds > 1:
+            self.edge = 1.0 - np.minimum(1.0, np.abs(positions(num_leds) - 0.5) * 2.0)
+        else:
+            self.edge = np.zeros(num_leds)
+        self.profile = np.zeros(num_leds)
+        self.roll = np.zeros(num_leds)
+
+    def init(self, color):
+        super().init(color)
+        self.phase = 0.0
+
+    def lamp_scale_factor(self):
+        self.phase += 0.03
+        vignette_shift = 0.5 + 0.1 * math.sin(self.phase)
+        self.global_dark = 0.35 + 0.25 * (1.0 - abs(0.5 - vignette_shift) * 2.0)
+        return self.surge_scale()
+
+    def pixel_scale(self):
+        profile = self.profile
+        np.multiply(self.edge, 1.0 - self.global_dark, out=profile)
+        profile += self.global_dark
+
+        # 4% of pixels glitch; below the threshold roll / 0.04 is itself
+        # uniform, so one draw picks both which pixels and by how much
+        roll = self.noise.uniform(0.0, 1.0, self.roll)
+        glitch = roll < 0.04
+        profile[glitch] *= 0.4 + 1.1 * (roll[glitch] / 0.04)
+        return profile
+
+
+@register
+class AlertEffect(Effect):
+    name = "alert"
+    delay = 0.04
+
+    def init(self, color):
+        super().init(color)
+        self.phase = 0.0
+
+    def render(self, frame, t):
+        self.phase += 0.12
+        level = (math.sin(self.phase) + 1.0) / 2.0
+        level = level * level
+        frame[:] = (int(255 * level), 0, 0)
+        return True
+
+
+@register
+class WaterEffect(Effect):
+    name = "water"
+    delay = 0.02
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        self.jitter = np.zeros(num_leds)
+
+    def render(self, frame, t):
+        if self.num_leds <= 1:
+            return True
+        render_water(frame, t, self.noise.uniform(-0.03, 0.03, self.jitter))
+        return True
+
+    def next_delay(self):
+        return self.delay if self.num_leds > 1 else 0.04
+
+
+@register
+class CoveWarmEffect(Effect):
+    name = "cove_warm"
+    kelvin = 3200
+    curve = 1.0
+    fade_steps = 100
+
+    def __init__(self, num_leds, lamp_count):
+        super().__init__(num_leds, lamp_count)
+        self.target = kelvin_lut(self.kelvin)
+        # smoothstep (then curve) fade from black, one colour per step
+        a = np.arange(1, self.fade_steps + 1) / float(self.fade_steps)
+        a = a * a * (3.0 - 2.0 * a)
+        if self.curve != 1.0:
+            a = a ** self.curve
+        self.ramp = (a[:, None] * np.array(self.target)).astype(np.uint8)
+
+    def init(self, color):
+        super().init(color)
+        self.step = 0
+
+    def render(self, frame, t):
+        if self.step < self.fade_steps:
+            self.step += 1
+            frame[:] = self.ramp[self.step - 1]
+        else:
+            frame[:] = self.target
+        return True
+
+    def next_delay(self):
+        return 0.025 if self.step < self.fade_steps else 0.08
+
+
+@register
+class CoveWarmTestEffect(CoveWarmEffect):
+    name = "cove_warm_test"
+    kelvin = 2600
+    curve = 2.2
+
+
+@register
+class AuroraEffect(Effect):
+    name = "aurora"
+
+    def init(self, color):
+        super().init(color)
+        self.speed = self.noise.uniform1(0.06, 0.10)
+        self.warp = self.noise.uniform1(0.15, 0.25)
+        self.bend = self.noise.uniform1(0.6, 1.0)
+        self.hue_shift = self.noise.uniform1(0.0, 1.0)
+
+    def render(self, frame, t):
+        render_aurora(frame, t, self.speed, self.bend, self.hue_shift)
+        return True
+
+
+@register
+class TestEffect(Effect):
+    # one white pulse, then done is set so the loop can restore the previous mode
+    name = "test"
+    duration = 0.5
+
+    def init(self, color):
+        super().init(color)
+        self.start = None
+
+    def render(self, frame, t):
+        if self.start is None:
+            self.start = t
+
+        elapsed = t - self.start
+        if elapsed >= self.duration:
+            self.done = True
+            return False
+
+        level = max(0.0, math.sin(math.pi * elapsed / self.duration))
+        v = int(255 * level)
+        frame[:] = (v, v, v)
+        return True
+
+    def next_delay(self):
+        return 0.01 if self.done else 0.02
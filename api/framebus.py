@@ -0,0 +1,169 @@
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+from multiprocessing import shared_memory
+
+# Shared-memory ring of rendered frames. The render loop publishes every
+# frame it draws; any local process can attach by name and read the newest
+# frame without talking to the render thread.
+#
+# Layout (little endian):
+#   header   magic u32, leds u32, capacity u32, pad u32, published u64
+#   slot_seq u64 * capacity   seqlock per slot: odd while being written
+#   stamps   f64 * capacity   time.time() of each frame
+#   frames   u8 * capacity * leds * 3
+
+MAGIC = 0x54524C46  # "TRLF"
+HEADER = struct.Struct("<IIIIQ")
+
+
+def _layout(leds, capacity):
+    seq_off = HEADER.size
+    stamp_off = seq_off + 8 * capacity
+    frame_off = stamp_off + 8 * capacity
+    size = frame_off + capacity * leds * 3
+    return seq_off, stamp_off, frame_off, size
+
+
+class _Ring:
+    def _map(self, leds, capacity):
+        buf = self.shm.buf
+        seq_off, stamp_off, frame_off, _ = _layout(leds, capacity)
+        self.leds = leds
+        self.capacity = capacity
+        self.header = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=HEADER.size - 8)
+        self.slot_seq = np.ndarray((capacity,), dtype=np.uint64, buffer=buf, offset=seq_off)
+        self.stamps = np.ndarray((capacity,), dtype=np.float64, buffer=buf, offset=stamp_off)
+        self.frames = np.ndarray((capacity, leds, 3), dtype=np.uint8, buffer=buf, offset=frame_off)
+
+    @property
+    def published(self):
+        return int(self.header[0])
+
+    def _release(self):
+        # numpy views must go before the mapping can be closed
+        self.header = self.slot_seq = self.stamps = self.frames = None
+        self.shm.close()
+
+
+class FrameBusWriter(_Ring):
+    def __init__(self, name, leds, capacity=8):
+        size = _layout(leds, capacity)[3]
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a previous run that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, leds, capacity, 0, 0)
+        self._map(leds, capacity)
+
+    def publish(self, frame, stamp=None):
+        n = self.published
+        i = n % self.capacity
+        gen = (n // self.capacity) * 2
+        self.slot_seq[i] = gen + 1
+        self.frames[i] = frame
+        self.stamps[i] = time.time() if stamp is None else stamp
+        self.slot_seq[i] = gen + 2
+        self.header[0] = n + 1
+
+    def close(self, unlink=True):
+        self._release()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class _Attached:
+    # the parts of SharedMemory a reader uses, mapped without the tracker
+    def __init__(self, name):
+        import _posixshmem
+        fd = _posixshmem.shm_open("/" + name, os.O_RDWR, mode=0o600)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        self.name = name
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+
+class FrameBusReader(_Ring):
+    def __init__(self, shm):
+        self.shm = shm
+        magic, leds, capacity, _, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError("not a TruLight frame bus")
+        self._map(leds, capacity)
+        self.out = np.zeros((leds, 3), dtype=np.uint8)
+
+    @classmethod
+    def attach(cls, name):
+        # Readers stay out of the resource tracker entirely: the writer owns
+        # the segment and its cleanup. The tracker is shared with a spawned
+        # render process and keeps one entry per name, so registering and
+        # unregistering here would drop the writer's own entry.
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 always registers SharedMemory attachments
+            try:
+                shm = _Attached(name)
+            except FileNotFoundError:
+                return None
+        except FileNotFoundError:
+            return None
+        return cls(shm)
+
+    def view(self, seq):
+        # zero-copy view of frame number seq (1-based); only valid while
+        # valid(seq) still returns True afterwards
+        i = (seq - 1) % self.capacity
+        return self.frames[i]
+
+    def valid(self, seq):
+        i = (seq - 1) % self.capacity
+        return int(self.slot_seq[i]) == ((seq - 1) // self.capacity) * 2 + 2
+
+    def latest(self, out=None, retries=4):
+        # copy the newest complete frame into out; returns (seq, stamp, frame)
+        # or None when nothing has been published yet
+        if out is None:
+            out = self.out
+        for _ in range(retries):
+            seq = self.published
+            if seq == 0:
+                return None
+            if not self.valid(seq):
+                continue
+            i = (seq - 1) % self.capacity
+            out[:] = self.frames[i]
+            stamp = float(self.stamps[i])
+            if self.valid(seq):
+                return seq, stamp, out
+        return None
+
+    def close(self):
+        self._release()
+
+
+def unlink(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
@@ -1,11 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from colorControl import set_color, set_mode
-from typing import Optional, Dict, Any
+from colorControl import (
+    add_cue, add_state_listener, add_timeline, apply_batch, bake_clip, cancel_cue, get_frame_reader, get_metrics, get_startup, get_state,
+    list_clips, list_cues, resume, set_brightness, set_color, set_mode, set_target_fps, shutdown, validate_op,
+)
+from typing import Optional, Dict, Any, List
+import asyncio
 import json
+from contextlib import asynccontextmanager
+import struct
+
+from protocol import StateHub, decode_command, encode_ack, encode_error
+
+hub = StateHub()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # start rendering the saved scene before any client connects; the driver
+    # opens on the render thread so the server is up without waiting for it
+    hub.attach(asyncio.get_running_loop(), add_state_listener(hub.notify))
+    resume()
+    yield
+    # blocking join of the render loop, off the event loop
+    await asyncio.to_thread(shutdown)
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -28,33 +48,351 @@ class Command(BaseModel):
     action: str
     payload: Optional[Dict[str, Any]] = None 
 
+class Batch(BaseModel):
+    ops: List[Command]
+
+class CueRequest(BaseModel):
+    ops: List[Command]
+    at: Optional[float] = None
+    after: Optional[float] = None
+    repeat: Optional[float] = None
+
+class Keyframe(BaseModel):
+    offset: float
+    ops: List[Command]
+
+class TimelineRequest(BaseModel):
+    keyframes: List[Keyframe]
+    at: Optional[float] = None
+    after: Optional[float] = None
+    repeat: Optional[float] = None
+
+class ClipRequest(BaseModel):
+    mode: str
+    seconds: float = 10.0
+    fps: float = 40.0
+    seed: int = 0
+
 @app.get("/health")
 def health():
-    return {"status":"ok"}
+    # seconds from process start to each milestone (None until reached)
+    return {"status":"ok", "startup": get_startup()}
+
+@app.get("/metrics")
+def metrics():
+    stats = get_metrics()
+    stats["state_push"] = hub.stats()
+    return stats
+
+@app.get("/frame")
+def frame(format: str = "json"):
+    reader = get_frame_reader()
+    latest = reader.latest() if reader is not None else None
+    if latest is None:
+        raise HTTPException(status_code=503, detail="No frame rendered yet")
+
+    seq, stamp, pixels = latest
+    if format == "raw":
+        return Response(
+            content=pixels.tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Frame-Seq": str(seq), "X-Frame-Time": f"{stamp:.6f}"},
+        )
+    return {"seq": seq, "time": stamp, "leds": len(pixels), "rgb": pixels.tobytes().hex()}
+
+@app.get("/clips")
+def clips():
+    return {"clips": list_clips()}
+
+# baking renders every frame up front, so this stays a plain def and runs in
+# the threadpool instead of blocking the event loop
+@app.post("/clips")
+def bake(req: ClipRequest):
+    try:
+        clip = bake_clip(req.mode, req.seconds, req.fps, req.seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "clip": clip, "play": f"clip:{req.mode}"}
 
 @app.post("/color")
-def color(cmd: Command):
+async def color(cmd: Command):
     if cmd.action == "set_color" and cmd.payload:
-       col = json.dumps(cmd.payload)
-       colDict = json.loads(col)
-       r, g, b = colDict["r"], colDict["g"], colDict["b"]
-       set_color(r, g, b)
+       r, g, b = cmd.payload.get("r"), cmd.payload.get("g"), cmd.payload.get("b")
+       try:
+           set_color(r, g, b, cmd.payload.get("transition"))
+       except ValueError as e:
+           raise HTTPException(status_code=400, detail=str(e))
        return {"status": "ok", "mode": cmd.action}
     
     else:
         raise HTTPException(status_code=400, detail=f"Unknown action {cmd.action!r}")
 
+@app.post("/brightness")
+async def brightness(cmd: Command):
+    if cmd.action != "set_brightness" or not cmd.payload:
+        raise HTTPException(status_code=400, detail=f"Unknown action {cmd.action!r}")
+    try:
+        result = set_brightness(cmd.payload.get("brightness"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **result}
+
 @app.post("/command")
-def command(cmd: Command):
+async def command(cmd: Command):
     if cmd.action == "set_mode" and cmd.payload:
         mode = cmd.payload.get("mode")
-        set_mode(mode)
+        try:
+            set_mode(mode, cmd.payload.get("transition"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         return {"status": "ok", "mode": mode}
 
+    if cmd.action == "set_fps" and cmd.payload:
+        try:
+            result = set_target_fps(cmd.payload.get("mode"), cmd.payload.get("fps"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "ok", **result}
+
+    raise HTTPException(status_code=400, detail=f"Unknown action {cmd.action!r}")
+
+@app.post("/batch")
+async def batch(req: Batch):
+    try:
+        state = apply_batch([(op.action, op.payload) for op in req.ops])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **state}
+
+# Scheduled scenes: "at" is a Unix time, "after" is seconds from now and
+# "repeat" re-arms the cue (or every keyframe of a timeline) that often.
+@app.get("/cues")
+def cues():
+    return {"cues": list_cues()}
+
+@app.post("/cues")
+async def create_cue(req: CueRequest):
+    try:
+        cue = add_cue([(op.action, op.payload) for op in req.ops], req.at, req.after, req.repeat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "cue": cue}
+
+@app.post("/cues/timeline")
+async def create_timeline(req: TimelineRequest):
+    keyframes = [(k.offset, [(op.action, op.payload) for op in k.ops]) for k in req.keyframes]
+    try:
+        result = add_timeline(keyframes, req.at, req.after, req.repeat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **result}
+
+@app.delete("/cues/{cue_id}")
+async def delete_cue(cue_id: str):
+    removed = cancel_cue(cue_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No cue or timeline {cue_id!r}")
+    return {"status": "ok", "removed": removed}
+
 @app.post("/test")
-def test_lights(cmd: Command):
+async def test_lights(cmd: Command):
     if cmd.action == "test":
         set_mode("test")
         return {"status": "ok"}
 
 
+# Streaming control: clients send {"c": [r, g, b]} or {"m": "mode"}, optionally
+# with a sequence number "s". Messages that arrive faster than one animation
+# frame are coalesced so only the newest colour/mode is applied, and every
+# applied batch is acknowledged with the resulting state.
+WS_APPLY_INTERVAL = 0.02
+
+def _parse_stream_message(msg):
+    if not isinstance(msg, dict):
+        raise ValueError("expected an object")
+    if "c" in msg:
+        if not isinstance(msg["c"], list) or len(msg["c"]) != 3:
+            raise ValueError("'c' must be [r, g, b]")
+        color, _ = validate_op("set_color", dict(zip("rgb", msg["c"])))
+        return "c", color
+    if "m" in msg:
+        mode, _ = validate_op("set_mode", {"mode": msg["m"]})
+        return "m", mode
+    raise ValueError("expected 'c' or 'm'")
+
+async def _receive_raw(websocket):
+    # one text or binary message; decoding is left to the caller so a bad
+    # message can be answered instead of ending the connection
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return message["text"]
+    return message.get("bytes") or b""
+
+def _apply_stream_update(kind, value):
+    if kind == "c":
+        set_color(*value)
+    elif kind == "b":
+        set_brightness(value)
+    else:
+        set_mode(value)
+
+@app.websocket("/ws")
+async def stream(websocket: WebSocket):
+    await websocket.accept()
+    pending = {}
+    seq = {"last": None}
+    wake = asyncio.Event()
+    errors = []
+
+    async def reader():
+        while True:
+            raw = await _receive_raw(websocket)
+            try:
+                msg = json.loads(raw)
+                kind, value = _parse_stream_message(msg)
+            except (ValueError, TypeError) as e:
+                # replies are sent by the loop below, never from here
+                errors.append({"error": str(e)})
+                wake.set()
+                continue
+            # re-insert so updates are applied in the order they last arrived
+            pending.pop(kind, None)
+            pending[kind] = value
+            if isinstance(msg, dict) and "s" in msg:
+                seq["last"] = msg["s"]
+            wake.set()
+
+    read_task = asyncio.create_task(reader())
+    try:
+        while True:
+            wait_task = asyncio.create_task(wake.wait())
+            done, _ = await asyncio.wait({read_task, wait_task}, return_when=asyncio.FIRST_COMPLETED)
+            if read_task in done:
+                wait_task.cancel()
+                read_task.result()
+                break
+
+            wake.clear()
+            while errors:
+                await websocket.send_json(errors.pop(0))
+            updates = list(pending.items())
+            pending.clear()
+            if not updates:
+                continue
+            try:
+                for kind, value in updates:
+                    _apply_stream_update(kind, value)
+            except ValueError as e:
+                await websocket.send_json({"error": str(e), "s": seq["last"]})
+                continue
+
+            await websocket.send_json({"ok": True, "s": seq["last"], **get_state()})
+            await asyncio.sleep(WS_APPLY_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        read_task.cancel()
+
+
+# Binary preview: each message is an 8-byte little-endian frame sequence
+# followed by leds * 3 RGB bytes, sent only when a new frame was published.
+@app.websocket("/ws/frames")
+async def frame_stream(websocket: WebSocket, fps: float = 20.0):
+    await websocket.accept()
+    period = 1.0 / max(1.0, min(fps, 60.0))
+    last_seq = 0
+
+    async def drain():
+        # clients send nothing; this only notices when the socket closes,
+        # which a static scene (no new frames, so no sends) never would
+        while True:
+            await _receive_raw(websocket)
+
+    read_task = asyncio.create_task(drain())
+    try:
+        while not read_task.done():
+            reader = get_frame_reader()
+            latest = reader.latest() if reader is not None else None
+            if latest is not None and latest[0] != last_seq:
+                last_seq, _, pixels = latest
+                await websocket.send_bytes(struct.pack("<Q", last_seq) + pixels.tobytes())
+            await asyncio.wait({read_task}, timeout=period)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        read_task.cancel()
+        if read_task.done() and not read_task.cancelled():
+            read_task.exception()
+
+
+# Binary control and state push (see protocol.py). Commands are coalesced the
+# same way as on /ws; each applied batch is acknowledged with the last
+# sequence number, and state deltas from any client or cue are pushed to
+# every socket. One task does all the sending.
+@app.websocket("/ws/bin")
+async def binary_stream(websocket: WebSocket):
+    await websocket.accept()
+    updates = hub.subscribe()
+    pending = {}
+    seq = {"last": None}
+    wake = asyncio.Event()
+    errors = []
+
+    async def reader():
+        while True:
+            data = await _receive_raw(websocket)
+            try:
+                if isinstance(data, str):
+                    raise ValueError("expected a binary message")
+                kind, value, s = decode_command(data)
+            except ValueError as e:
+                errors.append(encode_error(0, str(e)))
+                wake.set()
+                continue
+            pending.pop(kind, None)
+            pending[kind] = value
+            seq["last"] = s
+            wake.set()
+
+    read_task = asyncio.create_task(reader())
+    push_task = asyncio.create_task(updates.get())
+    try:
+        while True:
+            wait_task = asyncio.create_task(wake.wait())
+            done, _ = await asyncio.wait({read_task, wait_task, push_task}, return_when=asyncio.FIRST_COMPLETED)
+            if read_task in done:
+                wait_task.cancel()
+                read_task.result()
+                break
+
+            if push_task in done:
+                await websocket.send_bytes(push_task.result())
+                push_task = asyncio.create_task(updates.get())
+
+            if wait_task not in done:
+                wait_task.cancel()
+                continue
+
+            wake.clear()
+            while errors:
+                await websocket.send_bytes(errors.pop(0))
+            batch = list(pending.items())
+            pending.clear()
+            if not batch:
+                continue
+            try:
+                for kind, value in batch:
+                    _apply_stream_update(kind, value)
+            except ValueError as e:
+                await websocket.send_bytes(encode_error(seq["last"], str(e)))
+                continue
+            await websocket.send_bytes(encode_ack(seq["last"], get_state()["generation"]))
+            await asyncio.sleep(WS_APPLY_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        read_task.cancel()
+        push_task.cancel()
+        hub.unsubscribe(updates)
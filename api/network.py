@@ -0,0 +1,255 @@
+import argparse
+import socket
+import struct
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# Network pixel outputs for ESP32/WLED-style nodes. Both senders expose the
+# same len/fill/blit/show surface as a NeoPixel strip, so they plug into
+# topology.py as "ddp" and "e131" drivers:
+#
+#   {"driver": "ddp", "host": "10.0.0.40", "length": 900}
+#   {"driver": "e131", "host": "10.0.0.41", "universe": 1, "length": 680}
+#
+# Packets (headers included) are built once; each frame is copied into them
+# through NumPy views and sent on a non-blocking socket. A send that would
+# block is dropped and counted rather than stalling the render loop.
+
+DDP_PORT = 4048
+DDP_HEADER = 10
+DDP_MAX_DATA = 1440  # 480 RGB pixels, fits a 1500 byte MTU
+DDP_FLAGS = 0x40  # version 1
+DDP_PUSH = 0x01
+DDP_TYPE_RGB8 = 0x0B
+DDP_ID_DISPLAY = 1
+
+E131_PORT = 5568
+E131_HEADER = 126
+E131_CHANNELS = 510  # 170 RGB pixels per universe
+E131_ACN_ID = b"ASC-E1.17\x00\x00\x00"
+
+
+class _UdpSender:
+    def __init__(self, host, port, length, order="RGB"):
+        self.addr = (host, port)
+        self.length = length
+        # wire byte i carries canvas channel perm[i]
+        self.perm = ["RGB".index(c) for c in order] if order != "RGB" else None
+        self.frame = np.zeros((length, 3), dtype=np.uint8)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.packets = []
+        self.views = []
+        self.sent = 0
+        self.dropped = 0
+        self.auto_write = False
+
+    def __len__(self):
+        return self.length
+
+    def __setitem__(self, index, value):
+        self.frame[index] = value
+
+    def fill(self, color):
+        self.frame[:] = color[:3]
+
+    def blit(self, frame):
+        self.frame[:] = frame
+
+    def _pack(self):
+        src = self.frame[:, self.perm] if self.perm else self.frame
+        flat = src.reshape(-1)
+        for view, start in self.views:
+            view[:] = flat[start:start + len(view)]
+
+    def _send(self, packet):
+        try:
+            self.sock.sendto(packet, self.addr)
+            self.sent += 1
+        except (BlockingIOError, InterruptedError):
+            self.dropped += 1
+
+    def stats(self):
+        return {"packets_sent": self.sent, "packets_dropped": self.dropped}
+
+    def close(self):
+        self.sock.close()
+
+
+class DDPSender(_UdpSender):
+    def __init__(self, host, length, port=DDP_PORT, order="RGB"):
+        super().__init__(host, port, length, order)
+        self.sequence = 0
+        total = length * 3
+        offset = 0
+        while offset < total or not self.packets:
+            size = min(DDP_MAX_DATA, total - offset)
+            packet = bytearray(DDP_HEADER + size)
+            struct.pack_into(">BBBBIH", packet, 0, DDP_FLAGS, 0, DDP_TYPE_RGB8, DDP_ID_DISPLAY, offset, size)
+            self.packets.append(packet)
+            self.views.append((np.frombuffer(packet, dtype=np.uint8, offset=DDP_HEADER), offset))
+            offset += size
+        self.packets[-1][0] |= DDP_PUSH
+
+    def show(self):
+        self._pack()
+        # 4-bit sequence, 0 means "unused" to receivers
+        self.sequence = self.sequence % 15 + 1
+        for packet in self.packets:
+            packet[1] = self.sequence
+            self._send(packet)
+
+
+class E131Sender(_UdpSender):
+    def __init__(self, host, length, universe=1, port=E131_PORT, order="RGB", source="TruLight", priority=100):
+        super().__init__(host, port, length, order)
+        self.universe = universe
+        self.sequence = 0
+        cid = uuid.uuid4().bytes
+        name = source.encode("utf-8")[:63].ljust(64, b"\x00")
+        total = length * 3
+        offset = 0
+        u = universe
+        while offset < total or not self.packets:
+            channels = min(E131_CHANNELS, total - offset)
+            size = E131_HEADER + channels
+            packet = bytearray(size)
+            struct.pack_into(">HH12sHI16s", packet, 0, 0x0010, 0x0000, E131_ACN_ID, 0x7000 | (size - 16), 0x00000004, cid)
+            struct.pack_into(">HI64sBHBBH", packet, 38, 0x7000 | (size - 38), 0x00000002, name, priority, 0, 0, 0, u)
+            struct.pack_into(">HBBHHHB", packet, 115, 0x7000 | (size - 115), 0x02, 0xA1, 0x0000, 0x0001, channels + 1, 0x00)
+            self.packets.append(packet)
+            self.views.append((np.frombuffer(packet, dtype=np.uint8, offset=E131_HEADER), offset))
+            offset += channels
+            u += 1
+
+    @property
+    def universes(self):
+        return len(self.packets)
+
+    def show(self):
+        self._pack()
+        self.sequence = (self.sequence + 1) & 0xFF
+        for packet in self.packets:
+            packet[111] = self.sequence
+            self._send(packet)
+
+
+class LoopbackReceiver:
+    # Stand-in for a LAN pixel node: counts packets, completed frames and
+    # sequence gaps (lost packets) for DDP or E1.31 on a local port. Each DDP
+    # data offset and each E1.31 universe is tracked as its own stream.
+    def __init__(self, protocol="ddp", host="127.0.0.1", port=None, bufsize=1 << 22):
+        self.protocol = protocol
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, bufsize)
+        self.sock.bind((host, port or 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        self.lost = 0
+        self._last_seq = {}
+        self._first_universe = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
+
+    def _gap(self, stream, seq, modulo, first):
+        last = self._last_seq.get(stream)
+        self._last_seq[stream] = seq
+        if last is None:
+            return 0
+        expected = (last - first + 1) % modulo + first
+        return (seq - expected) % modulo
+
+    def _run(self):
+        buf = bytearray(2048)
+        while self._running:
+            try:
+                n = self.sock.recv_into(buf)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.packets += 1
+            self.bytes += n
+            if self.protocol == "ddp":
+                offset = struct.unpack_from(">I", buf, 4)[0]
+                if buf[1]:
+                    self.lost += self._gap(offset, buf[1], 15, 1)
+                if buf[0] & DDP_PUSH:
+                    self.frames += 1
+            else:
+                universe = struct.unpack_from(">H", buf, 113)[0]
+                self.lost += self._gap(universe, buf[111], 256, 0)
+                # count a frame each time the first universe comes round
+                if self._first_universe is None or universe < self._first_universe:
+                    self._first_universe = universe
+                if universe == self._first_universe:
+                    self.frames += 1
+
+    def stats(self):
+        return {"packets": self.packets, "bytes": self.bytes, "frames": self.frames, "lost_packets": self.lost}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send frames to a local receiver and report throughput and loss")
+    parser.add_argument("--protocol", choices=("ddp", "e131"), default="ddp")
+    parser.add_argument("--pixels", type=int, default=2000)
+    parser.add_argument("--fps", type=float, default=40.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    receiver = LoopbackReceiver(args.protocol).start()
+    if args.protocol == "ddp":
+        sender = DDPSender("127.0.0.1", args.pixels, port=receiver.port)
+    else:
+        sender = E131Sender("127.0.0.1", args.pixels, port=receiver.port)
+
+    rng = np.random.default_rng(0)
+    period = 1.0 / args.fps
+    frames = int(args.seconds * args.fps)
+    pack = 0.0
+    start = time.monotonic()
+    deadline = start
+    for _ in range(frames):
+        frame = rng.integers(0, 256, size=(args.pixels, 3), dtype=np.uint8)
+        t0 = time.perf_counter()
+        sender.blit(frame)
+        sender.show()
+        pack += time.perf_counter() - t0
+        deadline += period
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.monotonic() - start
+    time.sleep(0.3)
+    receiver.stop()
+    sender.close()
+
+    got = receiver.stats()
+    print(f"protocol      {args.protocol}  ({len(sender.packets)} packets/frame)")
+    print(f"frames sent   {frames} in {elapsed:.2f}s ({frames / elapsed:.1f} fps)")
+    print(f"send cost     {pack / frames * 1e6:.0f} us/frame")
+    print(f"packets       sent {sender.sent}, dropped at socket {sender.dropped}, received {got['packets']}")
+    print(f"throughput    {got['bytes'] * 8 / elapsed / 1e6:.2f} Mbit/s")
+    print(f"frames        received {got['frames']}, lost packets {got['lost_packets']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+
+# Per-effect random source. Array draws fill a caller-owned buffer in one
+# Generator call instead of one interpreter-level random call per pixel, and
+# each effect has its own stream so seeding one (bench, clips) makes its
+# output reproducible without touching the global random state.
+
+
+class Noise:
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    # whole-buffer draws, written into out (float64)
+    def uniform(self, lo, hi, out):
+        self.rng.random(out=out)
+        out *= hi - lo
+        out += lo
+        return out
+
+    def normal(self, sigma, out):
+        self.rng.standard_normal(out=out)
+        out *= sigma
+        return out
+
+    # scalars for per-frame decisions
+    def random(self):
+        return self.rng.random()
+
+    def uniform1(self, lo, hi):
+        return lo + (hi - lo) * self.rng.random()
+
+    def randint(self, lo, hi):
+        # inclusive, like random.randint
+        return int(self.rng.integers(lo, hi + 1))
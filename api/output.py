@@ -0,0 +1,44 @@
+import numpy as np
+
+from render import new_frame, write_frame
+
+
+class PixelOutput:
+    # Keeps a copy of the last frame that went out on the wire and only calls
+    # pixels.show() when the new frame differs from it. Uniform frames are
+    # written with a single fill() instead of a per-pixel copy.
+    def __init__(self, pixels, num_leds):
+        self.pixels = pixels
+        self.last = new_frame(num_leds)
+        self.valid = False
+        self.sent = 0
+        self.skipped = 0
+        self.fills = 0
+
+    def invalidate(self):
+        self.valid = False
+
+    def push(self, frame):
+        if self.valid and np.array_equal(frame, self.last):
+            self.skipped += 1
+            return False
+
+        first = frame[0]
+        if (frame == first).all():
+            self.pixels.fill((int(first[0]), int(first[1]), int(first[2])))
+            self.fills += 1
+        else:
+            write_frame(self.pixels, frame)
+
+        self.pixels.show()
+        self.last[:] = frame
+        self.valid = True
+        self.sent += 1
+        return True
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "uniform_fills": self.fills,
+        }
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+# Small JSON state file that survives restarts. Writes are debounced: save()
+# only remembers the newest data and pushes back a deadline, and one writer
+# thread waiting on a Condition writes it once things have been quiet for
+# `delay` seconds, so dragging a slider costs one write instead of hundreds;
+# a steady stream of changes is still written every `max_wait`. save() is a
+# lock and a few assignments, cheap enough to call from request handlers.
+# Each write goes to a temporary file that is fsynced and then renamed over
+# the old one, so a power cut leaves either the old or the new file, never a
+# torn one.
+
+
+class StateStore:
+    def __init__(self, path, delay=1.0, max_wait=5.0):
+        self.path = path
+        self.delay = delay
+        self.max_wait = max_wait
+        self.pending = None
+        self.pending_since = None
+        self.due = None
+        self.cond = threading.Condition()
+        # held across take-and-write so an older snapshot never lands last
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.writes = 0
+        self.last_write = None
+        self.errors = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable state file {self.path}: {e}")
+            return None
+        return data if isinstance(data, dict) else None
+
+    def save(self, data):
+        now = time.monotonic()
+        with self.cond:
+            idle = self.pending is None
+            if idle:
+                self.pending_since = now
+            self.pending = data
+            self.due = min(now + self.delay, self.pending_since + self.max_wait)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+                self.thread.start()
+            elif idle:
+                # the writer only wakes by itself while something is pending
+                self.cond.notify()
+
+    def flush(self):
+        with self.write_lock:
+            with self.cond:
+                data, self.pending = self.pending, None
+            if data is not None:
+                self._write(data)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None or time.monotonic() < self.due:
+                    self.cond.wait(None if self.pending is None else self.due - time.monotonic())
+            self.flush()
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or "."
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            # make the rename itself durable
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            self.errors += 1
+            print(f"Could not write state file {self.path}: {e}")
+            return
+        self.writes += 1
+        self.last_write = time.time()
+
+    def stats(self):
+        return {"path": self.path, "writes": self.writes, "errors": self.errors, "last_write": self.last_write}
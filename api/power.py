@@ -0,0 +1,66 @@
+import numpy as np
+
+from render import new_frame
+
+# Supply budget for the whole canvas. Each frame's current is estimated from
+# its per-channel sums (a WS2812 draws roughly 20 mA per channel at full
+# level plus about 1 mA idle), and frames that would exceed the budget are
+# scaled down uniformly with an 8-bit integer factor, rounding down so the
+# result always lands under the limit.
+#
+#   TRULIGHT_POWER_LIMIT_MA   supply budget for the LEDs (0 = estimate only)
+#   TRULIGHT_LED_MA           mA per channel at 255, "20" or "20,20,20"
+#   TRULIGHT_LED_IDLE_MA      quiescent mA per LED
+
+
+class PowerLimiter:
+    def __init__(self, num_leds, budget_ma=0.0, channel_ma=(20.0, 20.0, 20.0), idle_ma=1.0):
+        self.num_leds = num_leds
+        self.budget_ma = budget_ma
+        self.per_level = np.array(channel_ma) / 255.0
+        self.ones = np.ones(num_leds, dtype=np.float32)
+        self.idle_ma = idle_ma * num_leds
+        self.out = new_frame(num_leds)
+        self.acc = np.zeros((num_leds, 3), dtype=np.uint16)
+        self.estimated_ma = self.idle_ma
+        self.peak_ma = self.idle_ma
+        self.requested_ma = self.idle_ma
+        self.limited = 0
+        self.frames = 0
+
+    def estimate(self, frame):
+        # ones @ frame gives the per-channel sums in one BLAS call
+        return self.idle_ma + float(self.ones @ frame @ self.per_level)
+
+    def apply(self, frame):
+        # returns the frame to send, scaled into self.out when over budget
+        draw = self.estimate(frame)
+        self.frames += 1
+        self.requested_ma = draw
+        if self.budget_ma <= 0 or draw <= self.budget_ma:
+            self._record(draw)
+            return frame
+
+        headroom = max(0.0, self.budget_ma - self.idle_ma)
+        factor = int(256 * headroom / (draw - self.idle_ma))
+        np.multiply(frame, factor, out=self.acc, dtype=np.uint16)
+        np.right_shift(self.acc, 8, out=self.acc)
+        np.copyto(self.out, self.acc, casting="unsafe")
+        self.limited += 1
+        self._record(self.estimate(self.out))
+        return self.out
+
+    def _record(self, draw):
+        self.estimated_ma = draw
+        if draw > self.peak_ma:
+            self.peak_ma = draw
+
+    def stats(self):
+        return {
+            "budget_ma": self.budget_ma,
+            "estimated_ma": round(self.estimated_ma, 1),
+            "requested_ma": round(self.requested_ma, 1),
+            "peak_ma": round(self.peak_ma, 1),
+            "limited_frames": self.limited,
+            "frames": self.frames,
+        }
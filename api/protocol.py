@@ -0,0 +1,147 @@
+import asyncio
+import struct
+
+# Compact binary protocol for /ws/bin (all little endian).
+#
+# Client -> server, every message starts with an op byte and a u16 sequence:
+#   0x01 COLOR       op, seq, r, g, b                       6 bytes
+#   0x02 MODE        op, seq, len u8, utf-8 mode name
+#   0x03 BRIGHTNESS  op, seq, level u8 (0-255 -> 0-1)      4 bytes
+#
+# Server -> client:
+#   0x81 ACK         op, seq u16, generation u32            7 bytes
+#   0x82 STATE       op, generation u32, field mask u8, then the fields that
+#                    changed in mask order: color (3 bytes), brightness (u8),
+#                    mode (len u8 + utf-8)
+#   0x83 ERROR       op, seq u16, utf-8 message
+#
+# A new client first gets a STATE with every field; after that STATE messages
+# carry only what changed, and are broadcast to every connected client so
+# several UIs stay in sync without polling.
+
+OP_COLOR = 0x01
+OP_MODE = 0x02
+OP_BRIGHTNESS = 0x03
+OP_ACK = 0x81
+OP_STATE = 0x82
+OP_ERROR = 0x83
+
+FIELD_COLOR = 0x01
+FIELD_BRIGHTNESS = 0x02
+FIELD_MODE = 0x04
+ALL_FIELDS = FIELD_COLOR | FIELD_BRIGHTNESS | FIELD_MODE
+
+_HEAD = struct.Struct("<BH")
+_ACK = struct.Struct("<BHI")
+_STATE = struct.Struct("<BIB")
+
+
+def decode_command(data):
+    # returns (kind, value, seq) with kind "c", "m" or "b"; raises ValueError
+    if len(data) < _HEAD.size:
+        raise ValueError("message too short")
+    op, seq = _HEAD.unpack_from(data)
+    body = data[_HEAD.size:]
+    if op == OP_COLOR and len(body) == 3:
+        return "c", (body[0], body[1], body[2]), seq
+    if op == OP_BRIGHTNESS and len(body) == 1:
+        return "b", body[0] / 255.0, seq
+    if op == OP_MODE and body and len(body) == body[0] + 1:
+        return "m", bytes(body[1:]).decode("utf-8"), seq
+    raise ValueError(f"bad message op 0x{op:02x}")
+
+
+def encode_ack(seq, generation):
+    return _ACK.pack(OP_ACK, seq & 0xFFFF, generation & 0xFFFFFFFF)
+
+
+def encode_error(seq, message):
+    return _HEAD.pack(OP_ERROR, seq & 0xFFFF) + message.encode("utf-8")[:200]
+
+
+def encode_state(state, previous=None):
+    # previous=None sends every field
+    mask = ALL_FIELDS
+    if previous is not None:
+        mask = 0
+        if state.color != previous.color:
+            mask |= FIELD_COLOR
+        if state.brightness != previous.brightness:
+            mask |= FIELD_BRIGHTNESS
+        if state.mode != previous.mode:
+            mask |= FIELD_MODE
+        if not mask:
+            return None
+    out = bytearray(_STATE.pack(OP_STATE, state.generation & 0xFFFFFFFF, mask))
+    if mask & FIELD_COLOR:
+        out += bytes(state.color)
+    if mask & FIELD_BRIGHTNESS:
+        out.append(int(round(state.brightness * 255)))
+    if mask & FIELD_MODE:
+        name = state.mode.encode("utf-8")[:255]
+        out.append(len(name))
+        out += name
+    return bytes(out)
+
+
+class StateHub:
+    # Fans state deltas out to every subscribed socket. notify() may be called
+    # from any thread; bursts are coalesced into one delta per event-loop turn
+    # and each delta is encoded once for all clients. A client that falls
+    # behind has its queue cleared and gets a full state instead.
+    def __init__(self, queue_size=32):
+        self.loop = None
+        self.queue_size = queue_size
+        self.clients = set()
+        self.latest = None
+        self.sent = None
+        self.scheduled = False
+        self.broadcasts = 0
+        self.errors = 0
+
+    def attach(self, loop, state=None):
+        self.loop = loop
+        self.latest = self.sent = state
+
+    def notify(self, state):
+        self.latest = state
+        if self.loop is not None and not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon_threadsafe(self._flush)
+
+    def _flush(self):
+        self.scheduled = False
+        state = self.latest
+        try:
+            message = encode_state(state, self.sent)
+        except (TypeError, ValueError) as e:
+            # skip a state that cannot be encoded; the next delta is taken
+            # against the last one that went out
+            self.errors += 1
+            print(f"Could not push state {state.generation}: {e}")
+            return
+        self.sent = state
+        if message is None:
+            return
+        self.broadcasts += 1
+        for queue in self.clients:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                message_for = encode_state(state)
+            else:
+                message_for = message
+            queue.put_nowait(message_for)
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.queue_size)
+        if self.sent is not None:
+            queue.put_nowait(encode_state(self.sent))
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.discard(queue)
+
+    def stats(self):
+        return {"clients": len(self.clients), "broadcasts": self.broadcasts, "errors": self.errors}
@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+
+from colors import hsv_lut_array
+
+TWO_PI = 2.0 * math.pi
+
+WATER_BASE = np.array([0.0, 20.0, 80.0])
+WATER_SPAN = np.array([10.0, 180.0, 255.0]) - WATER_BASE
+
+_positions_cache = {}
+_lamp_cache = {}
+
+
+def new_frame(n):
+    return np.zeros((n, 3), dtype=np.uint8)
+
+
+def positions(n):
+    # same x = i / (n - 1) the per-pixel loops used; 0.5 for a single pixel
+    x = _positions_cache.get(n)
+    if x is None:
+        if n > 1:
+            x = np.arange(n, dtype=np.float64) / float(n - 1)
+        else:
+            x = np.full(n, 0.5)
+        x.flags.writeable = False
+        _positions_cache[n] = x
+    return x
+
+
+def render_water(out, t, jitter):
+    n = len(out)
+    if n <= 1:
+        return
+
+    x = positions(n)
+    w1 = np.sin(TWO_PI * (1.2 * x - 0.04 * t))
+    w2 = np.sin(TWO_PI * (2.7 * x + 0.07 * t))
+    w3 = 0.4 * np.sin(TWO_PI * (7.5 * x - 0.18 * t))
+
+    w = (w1 + w2 + w3) / 2.4
+    intensity = w * 0.5 + 0.5
+    intensity *= intensity
+    intensity += jitter
+    np.clip(intensity, 0.0, 1.0, out=intensity)
+
+    brightness = 0.15 + 0.85 * intensity
+    np.clip(brightness, 0.0, 1.0, out=brightness)
+
+    rgb = np.floor(WATER_BASE + WATER_SPAN * intensity[:, None])
+    rgb *= brightness[:, None]
+    out[:] = rgb
+
+
+def render_aurora(out, t, speed, bend, hue_shift):
+    n = len(out)
+    x = positions(n)
+
+    curtain = (
+        0.5
+        + 0.35 * np.sin(TWO_PI * (1.1 * x - speed * t))
+        + 0.15 * np.sin(TWO_PI * (0.5 * x - 0.4 * speed * t))
+    )
+    np.clip(curtain, 0.0, 1.0, out=curtain)
+
+    ripple = 0.5 + 0.5 * np.sin(TWO_PI * (3.5 * x - 1.8 * speed * t + bend * curtain))
+    ripple = 0.75 + 0.25 * ripple
+
+    intensity = (0.25 + 0.75 * curtain) * ripple
+
+    hue = (
+        0.35
+        + 0.45 * np.sin(TWO_PI * (0.15 * x - 0.12 * t))
+        + 0.10 * np.sin(TWO_PI * (0.05 * x + 0.07 * t))
+    )
+    hue = np.mod(hue + hue_shift, 1.0)
+
+    rgb = hsv_lut_array(hue, 0.85, np.minimum(intensity, 1.0))
+    rgb *= 255.0
+    out[:] = rgb
+
+
+def lamp_weights(n, lamp_count, radius, gamma, floor):
+    # Per-pixel (lamp index, level) for lamps centred at (i + 0.5) / lamp_count:
+    # the strongest lamp within radius (first one wins ties), with the floor
+    # folded in and 0 where no lamp reaches. The geometry never changes between
+    # frames, so each table is built once and shared read-only.
+    key = (n, lamp_count, radius, gamma, floor)
+    table = _lamp_cache.get(key)
+    if table is None:
+        x = positions(n)
+        centers = (np.arange(lamp_count) + 0.5) / float(lamp_count)
+        d = np.abs(x[:, None] - centers[None, :])
+        w = np.where(d < radius, 1.0 - d / radius, 0.0) ** gamma
+        index = np.argmax(w, axis=1)
+        best = w[np.arange(n), index]
+        level = np.where(best > 0.0, floor + (1.0 - floor) * best, 0.0)
+        index.flags.writeable = False
+        level.flags.writeable = False
+        table = _lamp_cache[key] = (index, level)
+    return table
+
+
+def render_lamps(out, index, level, lamp_rgb, lamp_scale, tint, pixel_scale=None, work=None):
+    # colour each lamp once, then one gather and one multiply per pixel
+    colors = lamp_rgb * (lamp_scale[:, None] * tint)
+    rgb = np.take(colors, index, axis=0, out=work)
+    if pixel_scale is None:
+        rgb *= level[:, None]
+    else:
+        rgb *= (level * pixel_scale)[:, None]
+    np.clip(rgb, 0.0, 255.0, out=rgb)
+    out[:] = rgb
+
+
+def write_frame(pixels, frame):
+    # copy the whole frame straight into the driver's byte buffer when it is
+    # a plain adafruit PixelBuf; otherwise fall back to one slice assignment
+    blit = getattr(pixels, "blit", None)
+    if blit is not None:
+        blit(frame)
+        return
+
+    n = len(frame)
+    buf = getattr(pixels, "_post_brightness_buffer", None)
+    order = getattr(pixels, "_byteorder", None)
+    if (
+        buf is not None
+        and order is not None
+        and getattr(pixels, "_pre_brightness_buffer", None) is None
+        and getattr(pixels, "_bpp", 0) == 3
+        and not getattr(pixels, "_dotstar_mode", False)
+    ):
+        offset = getattr(pixels, "_offset", 0)
+        view = np.frombuffer(buf, dtype=np.uint8, count=n * 3, offset=offset)
+        view.reshape(n, 3)[:, list(order[:3])] = frame
+        return
+
+    pixels[0:n] = frame.tolist()
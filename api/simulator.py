@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+
+
+class VirtualPixels:
+    # Stand-in for neopixel.NeoPixel with the same item/fill/show surface.
+    # Every show() copies the current buffer into a preallocated ring of
+    # frames, either in memory or in a .npy file opened as a memory map so
+    # another process (or np.load(path, mmap_mode="r")) can inspect it.
+    def __init__(self, n, capacity=256, path=None, clock=time.monotonic):
+        self.n = n
+        self.capacity = capacity
+        self.path = path
+        self.clock = clock
+        self.auto_write = False
+        self.brightness = 1.0
+        self.buf = np.zeros((n, 3), dtype=np.uint8)
+        if path:
+            self.frames = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(capacity, n, 3))
+        else:
+            self.frames = np.zeros((capacity, n, 3), dtype=np.uint8)
+        self.times = np.zeros(capacity)
+        self.shows = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [tuple(int(c) for c in px) for px in self.buf[index]]
+        return tuple(int(c) for c in self.buf[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.buf[index] = np.asarray(value, dtype=np.uint8).reshape(-1, 3)
+        else:
+            self.buf[index] = value[:3]
+        if self.auto_write:
+            self.show()
+
+    def fill(self, color):
+        self.buf[:] = color[:3]
+        if self.auto_write:
+            self.show()
+
+    def blit(self, frame):
+        self.buf[:] = frame
+
+    def show(self):
+        i = self.shows % self.capacity
+        self.frames[i] = self.buf
+        self.times[i] = self.clock()
+        self.shows += 1
+
+    def latest(self):
+        if self.shows == 0:
+            return None
+        return self.frames[(self.shows - 1) % self.capacity]
+
+    def recorded(self):
+        # frames in the ring, oldest first
+        if self.shows <= self.capacity:
+            return self.frames[:self.shows]
+        i = self.shows % self.capacity
+        return np.concatenate((self.frames[i:], self.frames[:i]))
+
+    def flush(self):
+        if isinstance(self.frames, np.memmap):
+            self.frames.flush()
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import numpy as np
+
+MAX_FPS = 240.0
+
+
+def parse_fps(fps):
+    # 0/None clears a target; anything else must be a rate the loop can keep
+    if fps is None:
+        return None
+    try:
+        fps = float(fps)
+    except (TypeError, ValueError):
+        raise ValueError("fps must be a number")
+    if fps == 0.0:
+        return None
+    if not 0.0 < fps <= MAX_FPS:
+        raise ValueError(f"fps must be between 0 and {MAX_FPS:g}")
+    return fps
+
+
+class FrameStats:
+    # fixed-size ring of per-frame timings (seconds) plus running counters
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self.render = np.zeros(capacity)
+        self.show = np.zeros(capacity)
+        self.jitter = np.zeros(capacity)
+        self.index = 0
+        self.count = 0
+        self.frames = 0
+        self.missed = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    def record(self, render_s, show_s, jitter_s):
+        i = self.index
+        self.render[i] = render_s
+        self.show[i] = show_s
+        self.jitter[i] = jitter_s
+        self.index = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.frames += 1
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.frames = 0
+        self.missed = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        n = self.count
+        out = {
+            "frames": self.frames,
+            "missed_deadlines": self.missed,
+            "skipped_frames": self.skipped,
+            "window": n,
+            "uptime_s": round(time.monotonic() - self.started, 3),
+        }
+        for key, ring in (("render_ms", self.render), ("show_ms", self.show), ("jitter_ms", self.jitter)):
+            if n == 0:
+                out[key] = None
+                continue
+            window = ring[:n] * 1000.0
+            out[key] = {
+                "mean": round(float(window.mean()), 3),
+                "p95": round(float(np.percentile(window, 95)), 3),
+                "max": round(float(window.max()), 3),
+            }
+        return out
+
+
+class FrameScheduler:
+    # Frames start on absolute deadlines (deadline += period) instead of
+    # sleeping a fixed amount after each render, so render and show time no
+    # longer stretch the frame period. When the loop falls more than a period
+    # behind, the missed slots are dropped rather than rendered back to back.
+    # interrupt() ends the current wait early and re-phases the deadlines to
+    # that moment, so a state change or cue shows on the very next frame.
+    def __init__(self, stats, clock=time.monotonic, sleep=None):
+        self.stats = stats
+        self.clock = clock
+        self.wake = threading.Event()
+        self.sleep = sleep or self._sleep
+        self.target_fps = {}
+        self.deadline = clock()
+        self.jitter = 0.0
+
+    def reset(self):
+        self.deadline = self.clock()
+        self.jitter = 0.0
+
+    def interrupt(self):
+        self.wake.set()
+
+    def _sleep(self, seconds):
+        if self.wake.wait(seconds):
+            self.wake.clear()
+            self.deadline = self.clock()
+
+    def set_target_fps(self, mode, fps):
+        fps = parse_fps(fps)
+        if fps:
+            self.target_fps[mode] = fps
+        else:
+            self.target_fps.pop(mode, None)
+
+    def period(self, mode, default):
+        fps = self.target_fps.get(mode)
+        if fps:
+            return 1.0 / fps
+        return default
+
+    def wait(self, period):
+        self.deadline += period
+        now = self.clock()
+        late = now - self.deadline
+
+        if late > 0.0:
+            self.stats.missed += 1
+            if late >= period > 0.0:
+                skip = int(late // period)
+                self.deadline += skip * period
+                self.stats.skipped += skip
+            self.jitter = now - self.deadline
+            return
+
+        self.sleep(-late)
+        self.jitter = self.clock() - self.deadline
+
+    def record(self, render_s, show_s):
+        self.stats.record(render_s, show_s, self.jitter)
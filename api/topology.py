@@ -0,0 +1,193 @@
+import json
+
+import numpy as np
+
+from output import PixelOutput
+
+# Output topology: effects render once into a logical canvas and each
+# physical strip takes its pixels from it through an index map. A config
+# file (TRULIGHT_STRIPS) is a JSON list of strips:
+#
+#   [
+#     {"driver": "neopixel", "pin": "D18", "length": 50, "order": "GRB"},
+#     {"driver": "neopixel", "pin": "D13", "length": 60,
+#      "segments": [{"start": 50, "length": 60, "reverse": true}]},
+#     {"driver": "spi", "length": 144, "order": "GRB"},
+#     {"driver": "ddp", "host": "10.0.0.40", "length": 900, "order": "RGB"}
+#   ]
+#
+# "segments" lists which canvas pixels feed the strip, in strip order. Without
+# it a strip takes the next "length" canvas pixels after the previous strip.
+# Colour order is handed to the driver, which reorders bytes as the frame is
+# copied into its buffer. It defaults to GRB for local strips and to RGB for
+# network drivers, whose receivers usually do their own reordering.
+
+NETWORK_DRIVERS = ("ddp", "e131")
+
+
+class Strip:
+    def __init__(self, name, driver, length, index_map, pin=None, order="GRB", options=None):
+        self.name = name
+        self.driver = driver
+        self.length = length
+        self.index_map = index_map
+        self.pin = pin
+        self.order = order
+        self.options = options or {}
+        self.identity = False
+
+
+def parse_strips(config):
+    strips = []
+    offset = 0
+    for i, entry in enumerate(config):
+        length = int(entry["length"])
+        segments = entry.get("segments")
+        if segments:
+            parts = []
+            for seg in segments:
+                start = int(seg["start"])
+                idx = np.arange(start, start + int(seg["length"]))
+                parts.append(idx[::-1] if seg.get("reverse") else idx)
+            index_map = np.concatenate(parts)
+            if len(index_map) != length:
+                raise ValueError(f"strip {i}: segments cover {len(index_map)} pixels, length is {length}")
+        else:
+            index_map = np.arange(offset, offset + length)
+            if entry.get("reverse"):
+                index_map = index_map[::-1]
+        if length:
+            offset = max(offset, int(index_map.max()) + 1)
+
+        driver = entry.get("driver", "neopixel")
+        order = entry.get("order", "RGB" if driver in NETWORK_DRIVERS else "GRB")
+        if driver in NETWORK_DRIVERS and sorted(order) != ["B", "G", "R"]:
+            raise ValueError(f"strip {i}: order must be a permutation of RGB, got {order!r}")
+
+        strips.append(Strip(
+            name=entry.get("name", f"strip{i}"),
+            driver=driver,
+            length=length,
+            index_map=index_map,
+            pin=entry.get("pin"),
+            order=order,
+            options={k: v for k, v in entry.items() if k not in (
+                "name", "driver", "length", "segments", "pin", "order", "reverse")},
+        ))
+
+    canvas = canvas_size(strips)
+    for strip in strips:
+        strip.identity = strip.length == canvas and np.array_equal(strip.index_map, np.arange(canvas))
+    return strips
+
+
+def canvas_size(strips):
+    return max((int(s.index_map.max()) + 1 for s in strips if s.length), default=0)
+
+
+def load_strips(path, default):
+    if not path:
+        return parse_strips(default)
+    with open(path) as f:
+        return parse_strips(json.load(f))
+
+
+def open_driver(strip):
+    if strip.driver == "neopixel":
+        import board
+        import neopixel
+        return neopixel.NeoPixel(
+            getattr(board, strip.pin or "D18"), strip.length,
+            auto_write=False, pixel_order=strip.order,
+        )
+
+    if strip.driver == "spi":
+        import board
+        import neopixel_spi
+        return neopixel_spi.NeoPixel_SPI(
+            board.SPI(), strip.length, auto_write=False, pixel_order=strip.order,
+        )
+
+    if strip.driver == "ddp":
+        from network import DDP_PORT, DDPSender
+        return DDPSender(
+            strip.options["host"], strip.length,
+            port=int(strip.options.get("port", DDP_PORT)), order=strip.order,
+        )
+
+    if strip.driver == "e131":
+        from network import E131_PORT, E131Sender
+        return E131Sender(
+            strip.options["host"], strip.length,
+            universe=int(strip.options.get("universe", 1)),
+            port=int(strip.options.get("port", E131_PORT)), order=strip.order,
+        )
+
+    if strip.driver == "sim":
+        from simulator import VirtualPixels
+        return VirtualPixels(
+            strip.length,
+            capacity=int(strip.options.get("frames", 256)),
+            path=strip.options.get("file"),
+        )
+
+    raise ValueError(f"unknown strip driver {strip.driver!r}")
+
+
+class StripOutput:
+    def __init__(self, strip, pixels):
+        self.strip = strip
+        self.pixels = pixels
+        self.output = PixelOutput(pixels, strip.length)
+        self.buf = np.zeros((strip.length, 3), dtype=np.uint8)
+
+    def push(self, canvas):
+        if self.strip.identity:
+            return self.output.push(canvas)
+        np.take(canvas, self.strip.index_map, axis=0, out=self.buf)
+        return self.output.push(self.buf)
+
+
+class MultiOutput:
+    # Same push()/stats() surface as PixelOutput. With more than one strip,
+    # slicing and show() for each strip run on a thread pool so drivers that
+    # release the GIL while transmitting overlap instead of adding up.
+    def __init__(self, outputs, workers=None):
+        self.outputs = outputs
+        self.pool = None
+        if len(outputs) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self.pool = ThreadPoolExecutor(max_workers=workers or len(outputs), thread_name_prefix="strip")
+
+    def push(self, canvas):
+        if self.pool is None:
+            return any([out.push(canvas) for out in self.outputs])
+        futures = [self.pool.submit(out.push, canvas) for out in self.outputs]
+        return any([f.result() for f in futures])
+
+    def invalidate(self):
+        for out in self.outputs:
+            out.output.invalidate()
+
+    def stats(self):
+        per_strip = {out.strip.name: out.output.stats() for out in self.outputs}
+        total = {"sent": 0, "skipped": 0, "uniform_fills": 0}
+        for s in per_strip.values():
+            for key in total:
+                total[key] += s[key]
+        total["strips"] = per_strip
+        return total
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        # release sockets and pins; NeoPixel calls it deinit()
+        for out in self.outputs:
+            close = getattr(out.pixels, "close", None) or getattr(out.pixels, "deinit", None)
+            if close is not None:
+                close()
+
+
+def build_output(strips, workers=None):
+    outputs = [StripOutput(strip, open_driver(strip)) for strip in strips]
+    return MultiOutput(outputs, workers)
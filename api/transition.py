@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+from render import new_frame
+
+# Crossfades between modes. While a transition runs the outgoing and incoming
+# effects each render into their own preallocated buffer and the two are mixed
+# with an 8-bit integer weight:
+#
+#   out = (old * (256 - w) + new * w + 128) >> 8
+#
+# so a transition frame costs two effect renders plus a few uint16 passes.
+# A spec is either a duration in seconds or {"duration": 1.5, "curve": "smoothstep"}.
+
+CURVES = {
+    "linear": lambda x: x,
+    "smoothstep": lambda x: x * x * (3.0 - 2.0 * x),
+    "ease_in": lambda x: x * x,
+    "ease_out": lambda x: 1.0 - (1.0 - x) * (1.0 - x),
+}
+DEFAULT_CURVE = "smoothstep"
+MAX_DURATION = 30.0
+
+
+def parse_spec(spec):
+    # returns (duration, curve) or None for a hard cut; raises ValueError
+    if spec is None:
+        return None
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        duration, curve = spec, DEFAULT_CURVE
+    elif isinstance(spec, dict):
+        duration, curve = spec.get("duration", 1.0), spec.get("curve", DEFAULT_CURVE)
+    else:
+        raise ValueError("transition must be a duration or {duration, curve}")
+    try:
+        duration = float(duration)
+    except (TypeError, ValueError):
+        raise ValueError("transition duration must be a number")
+    if not math.isfinite(duration) or not 0.0 <= duration <= MAX_DURATION:
+        raise ValueError(f"transition duration must be 0-{MAX_DURATION:g} seconds")
+    if not isinstance(curve, str) or curve not in CURVES:
+        raise ValueError(f"Unknown transition curve {curve!r}")
+    if duration == 0.0:
+        return None
+    return duration, curve
+
+
+class Transition:
+    def __init__(self, num_leds):
+        self.old = new_frame(num_leds)
+        self.new = new_frame(num_leds)
+        self.acc = np.zeros((num_leds, 3), dtype=np.uint16)
+        self.tmp = np.zeros((num_leds, 3), dtype=np.uint16)
+        self.outgoing = None
+        self.active = False
+
+    def start(self, frame, outgoing, duration, curve, now):
+        # Both buffers start from what is on the strip, so effects that only
+        # draw when something changes (static, off) still blend correctly.
+        # outgoing=None freezes the current frame, e.g. when a transition is
+        # interrupted by another mode change.
+        self.old[:] = frame
+        self.new[:] = frame
+        self.outgoing = outgoing
+        self.start_time = now
+        self.duration = duration
+        self.curve = CURVES[curve]
+        self.active = True
+
+    def stop(self):
+        self.outgoing = None
+        self.active = False
+
+    def render(self, frame, incoming, t, now):
+        progress = min(1.0, (now - self.start_time) / self.duration)
+        if self.outgoing is not None:
+            self.outgoing.render(self.old, t)
+        incoming.render(self.new, t)
+
+        if progress >= 1.0:
+            frame[:] = self.new
+            self.stop()
+            return True
+
+        w = int(round(self.curve(progress) * 256))
+        np.multiply(self.old, 256 - w, out=self.acc, dtype=np.uint16)
+        np.multiply(self.new, w, out=self.tmp, dtype=np.uint16)
+        self.acc += self.tmp
+        self.acc += 128
+        self.acc >>= 8
+        np.copyto(frame, self.acc, casting="unsafe")
+        return True
+
+    def next_delay(self, incoming):
+        delay = incoming.next_delay()
+        if self.outgoing is not None:
+            delay = min(delay, self.outgoing.next_delay())
+        return delay
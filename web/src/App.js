@@ -1,7 +1,7 @@
-import React, { useState, useMemo, useEffect } from "react";
+import React, { useState, useMemo, useEffect, useRef } from "react";
 import { RgbColorPicker } from "react-colorful";
 import throttle from "lodash.throttle";
-import { healthCheck, sendCommand, setColor, setMode } from "./api";
+import { healthCheck, openStateSocket, setColor, setMode } from "./api";
 
 function App() {
   const [status, setStatus] = useState(null);
@@ -9,6 +9,25 @@ function App() {
   const [color, setColorState] = useState({ r: 255, g: 255, b: 255 }); 
   const [showDropdown, setShowDropdown] = useState(false);
   const [isSmallScreen, setIsSmallScreen] = useState(false);
+  const socketRef = useRef(null);
+  const draggedAt = useRef(0);
+
+  useEffect(() => {
+    // every open UI follows changes made from any other client or a cue
+    const socket = openStateSocket(
+      (state) => {
+        // don't let our own echoed deltas pull the picker back mid-drag
+        if (state.color && Date.now() - draggedAt.current > 300) setColorState(state.color);
+        setResult(state);
+      },
+      (error) => setResult({ error })
+    );
+    socketRef.current = socket;
+    return () => {
+      socketRef.current = null;
+      socket.close();
+    };
+  }, []);
 
   useEffect(
     () => {
@@ -47,10 +66,16 @@ function App() {
 
   const handleColorChange = (nextColor) => {
     setColorState(nextColor);
-    setColorThrottled(nextColor);
+    draggedAt.current = Date.now();
+    const socket = socketRef.current;
+    if (!socket || !socket.sendColor(nextColor)) {
+      setColorThrottled(nextColor);
+    }
   };
 
   const handleSetMode = async (mode) => {
+    const socket = socketRef.current;
+    if (socket && socket.sendMode(mode)) return;
     try {
       const res = await setMode(mode);
       setResult(res);
@@ -33,4 +33,98 @@ export async function setColor(color) {
 
 export async function setMode(mode) {
   return sendCommand("set_mode", { mode });
-}
\ No newline at end of file
+}
+
+const WS_URL = `${BASE_URL.replace(/^http/, "ws")}/ws/bin`;
+
+// Binary control channel (see api/protocol.py). Commands are a few bytes each
+// and the server coalesces bursts, so callers can send on every picker
+// change. The server pushes state changes from any client as deltas; onState
+// gets the merged { generation, color, brightness, mode } after each one.
+// send* return false while disconnected so the caller can fall back to HTTP.
+const OP_COLOR = 0x01;
+const OP_MODE = 0x02;
+const OP_BRIGHTNESS = 0x03;
+const OP_ACK = 0x81;
+const OP_STATE = 0x82;
+const OP_ERROR = 0x83;
+const FIELD_COLOR = 0x01;
+const FIELD_BRIGHTNESS = 0x02;
+const FIELD_MODE = 0x04;
+
+const encoder = new TextEncoder();
+const decoder = new TextDecoder();
+
+export function openStateSocket(onState, onError) {
+  let ws = null;
+  let closed = false;
+  let retry = null;
+  let seq = 0;
+  const state = { generation: 0, color: null, brightness: null, mode: null };
+
+  const handle = (buffer) => {
+    const view = new DataView(buffer);
+    const op = view.getUint8(0);
+    if (op === OP_STATE) {
+      state.generation = view.getUint32(1, true);
+      const mask = view.getUint8(5);
+      let at = 6;
+      if (mask & FIELD_COLOR) {
+        state.color = { r: view.getUint8(at), g: view.getUint8(at + 1), b: view.getUint8(at + 2) };
+        at += 3;
+      }
+      if (mask & FIELD_BRIGHTNESS) {
+        state.brightness = view.getUint8(at) / 255;
+        at += 1;
+      }
+      if (mask & FIELD_MODE) {
+        const len = view.getUint8(at);
+        state.mode = decoder.decode(new Uint8Array(buffer, at + 1, len));
+      }
+      if (onState) onState({ ...state });
+    } else if (op === OP_ERROR && onError) {
+      onError(decoder.decode(new Uint8Array(buffer, 3)));
+    } else if (op === OP_ACK) {
+      // the matching STATE push carries the new values
+    }
+  };
+
+  const connect = () => {
+    ws = new WebSocket(WS_URL);
+    ws.binaryType = "arraybuffer";
+    ws.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer && event.data.byteLength > 0) handle(event.data);
+    };
+    ws.onclose = () => {
+      if (!closed) retry = setTimeout(connect, 1000);
+    };
+  };
+
+  const send = (op, body) => {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return false;
+    seq = (seq + 1) & 0xffff;
+    const msg = new Uint8Array(3 + body.length);
+    msg[0] = op;
+    msg[1] = seq & 0xff;
+    msg[2] = seq >> 8;
+    msg.set(body, 3);
+    ws.send(msg);
+    return true;
+  };
+
+  connect();
+
+  return {
+    sendColor: ({ r, g, b }) => send(OP_COLOR, [r, g, b]),
+    sendMode: (mode) => {
+      const name = encoder.encode(mode).slice(0, 255);
+      return send(OP_MODE, [name.length, ...name]);
+    },
+    sendBrightness: (level) => send(OP_BRIGHTNESS, [Math.round(Math.min(1, Math.max(0, level)) * 255)]),
+    close: () => {
+      closed = true;
+      clearTimeout(retry);
+      if (ws) ws.close();
+    },
+  };
+}